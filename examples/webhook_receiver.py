@@ -6,7 +6,6 @@ Run this to receive and verify webhook payloads locally
 from flask import Flask, request, jsonify
 import hmac
 import hashlib
-import json
 from datetime import datetime
 
 app = Flask(__name__)
@@ -22,7 +21,7 @@ def receive_webhook():
     """
     # Get request data
     payload = request.json
-    signature = request.headers.get('X-VoiceForm-Signature', '')
+    signature = request.headers.get('X-VoiceForm-Signature-V2', '')
     session_id = request.headers.get('X-VoiceForm-Session-ID', '')
     
     print("\n" + "=" * 70)
@@ -33,7 +32,7 @@ def receive_webhook():
     webhook_secret = None  # Set this to your webhook_secret to enable verification
     
     if webhook_secret:
-        if verify_signature(payload, signature, webhook_secret):
+        if verify_signature(request.get_data(), signature, webhook_secret):
             print("✅ Signature verified")
         else:
             print("❌ Invalid signature!")
@@ -147,26 +146,25 @@ def index():
     """
 
 
-def verify_signature(payload: dict, signature: str, webhook_secret: str) -> bool:
+def verify_signature(raw_body: bytes, signature: str, webhook_secret: str) -> bool:
     """
     Verify webhook signature
     
     Args:
-        payload: The webhook payload
-        signature: The signature from X-VoiceForm-Signature header
+        raw_body: The raw request body, exactly as received
+        signature: The signature from X-VoiceForm-Signature-V2 header
         webhook_secret: Your webhook secret
     
     Returns:
         True if signature is valid
     """
-    payload_str = json.dumps(payload, sort_keys=True)
     expected_signature = hmac.new(
         webhook_secret.encode(),
-        payload_str.encode(),
+        raw_body,
         hashlib.sha256
     ).hexdigest()
     
-    return f"sha256={expected_signature}" == signature
+    return hmac.compare_digest(f"sha256={expected_signature}", signature)
 
 
 if __name__ == '__main__':
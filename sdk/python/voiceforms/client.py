@@ -2,7 +2,7 @@
 VoiceForms Python SDK Client
 """
 import requests
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 import json
 
 
@@ -177,29 +177,33 @@ class VoiceFormSDK:
         return self._request('POST', f'/api/sessions/{session_id}/retry-webhook/')
     
     @staticmethod
-    def verify_webhook(payload: Dict, signature: str, webhook_secret: str) -> bool:
+    def verify_webhook(payload: Union[Dict, bytes, str], signature: str, webhook_secret: str) -> bool:
         """
         Verify webhook signature
         
+        Pass the raw request body with the X-VoiceForm-Signature-V2 header
+        (preferred). Passing the parsed payload checks the deprecated
+        X-VoiceForm-Signature header instead.
+        
         Args:
-            payload: The webhook payload
-            signature: The signature from X-VoiceForm-Signature header
+            payload: The raw request body, or the parsed webhook payload (legacy)
+            signature: The matching signature header value
             webhook_secret: Your webhook secret
         
         Returns:
             True if signature is valid
         """
         import hmac
-        import hashlib
         
-        payload_str = json.dumps(payload, sort_keys=True)
-        expected_signature = hmac.new(
-            webhook_secret.encode(),
-            payload_str.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        if isinstance(payload, bytes):
+            body = payload
+        elif isinstance(payload, str):
+            body = payload.encode('utf-8')
+        else:
+            body = json.dumps(payload, sort_keys=True).encode()
+        expected_signature = hmac.digest(webhook_secret.encode(), body, 'sha256').hex()
         
-        return f"sha256={expected_signature}" == signature
+        return hmac.compare_digest(f"sha256={expected_signature}", signature or '')
 
 
 # Helper functions for building form configurations
@@ -142,6 +142,11 @@ class LiveAudioInterface {
         console.log('Received message:', data);
         
         switch (data.type) {
+            case 'batch':
+                // Several control messages produced by one server event
+                (data.messages || []).forEach(message => this.handleMessage(message));
+                break;
+            
             case 'ready':
                 this.updateStatus(data.message);
                 this.enableControls();
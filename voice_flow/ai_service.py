@@ -10,10 +10,13 @@ Supports:
 For real-time voice, use the Live API (live_audio_service.py)
 For text-based interactions, this service provides fallback support.
 """
+import copy
+import hashlib
 import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Any, Callable, Dict, Optional
 from django.conf import settings
+from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +31,135 @@ except ImportError:
     logger.warning("google-genai not available. Install with: pip install google-genai")
 
 
+def _number_validator(validation: Dict) -> Callable[[Any], Optional[str]]:
+    integer_only = validation.get('integer_only', False)
+    min_value = validation.get('min')
+    max_value = validation.get('max')
+
+    def validate(value):
+        try:
+            num_value = float(value)
+        except (ValueError, TypeError):
+            return 'Must be a number'
+        if integer_only and not isinstance(value, int):
+            return 'Must be an integer'
+        if min_value is not None and num_value < min_value:
+            return f"Must be at least {min_value}"
+        if max_value is not None and num_value > max_value:
+            return f"Must be at most {max_value}"
+        return None
+    return validate
+
+
+def _email_validator(validation: Dict) -> Callable[[Any], Optional[str]]:
+    # Deliberately loose: only an '@' and a '.' are required
+    def validate(value):
+        text = str(value)
+        return None if '@' in text and '.' in text else 'Invalid email format'
+    return validate
+
+
+def _choice_validator(validation: Dict) -> Optional[Callable[[Any], Optional[str]]]:
+    options = validation.get('options', [])
+    if not options:
+        return None
+    error_message = f"Must be one of: {', '.join(options)}"
+
+    def validate(value):
+        return None if value in options else error_message
+    return validate
+
+
+# Type-specific validator factories keyed by field type
+_TYPE_VALIDATORS = {
+    'number': _number_validator,
+    'email': _email_validator,
+    'choice': _choice_validator,
+    'multi_choice': _choice_validator,
+}
+
+
+def compile_field_validator(field_def: Dict) -> Callable[[Any], Optional[str]]:
+    """
+    Build a validator for a field definition
+
+    Thresholds, options and patterns are resolved once here, so the returned
+    callable only does the per-value checks. It returns an error message or None.
+    """
+    required = field_def.get('required', False)
+    factory = _TYPE_VALIDATORS.get(field_def.get('type'))
+    type_check = factory(field_def.get('validation') or {}) if factory else None
+
+    def validate(value):
+        if value is None or value == '':
+            return 'This field is required' if required else None
+        return type_check(value) if type_check else None
+    return validate
+
+
+def _prompt_cache_key(kind: str, model_id: str, prompt: str) -> str:
+    """
+    Cache key for a model response, keyed by a hash of the model and prompt
+    
+    Only for prompts built from form designer input (schema generation).
+    Prompts embedding a respondent's conversation or answers are never
+    cached: they rarely repeat and would keep personal data in the shared
+    cache.
+    """
+    digest = hashlib.blake2b(f"{model_id}\0{prompt}".encode('utf-8'), digest_size=16).hexdigest()
+    return f"voice_flow:ai:{kind}:{digest}"
+
+
+def _cached_response(key: str):
+    try:
+        return cache.get(key)
+    except Exception as e:
+        logger.warning(f"AI response cache read failed: {e}")
+        return None
+
+
+def _cache_response(key: str, value) -> None:
+    try:
+        timeout = settings.VOICE_FORM_SETTINGS.get('AI_RESPONSE_CACHE_SECONDS', 86400)
+        cache.set(key, value, timeout)
+    except Exception as e:
+        logger.warning(f"AI response cache write failed: {e}")
+
+
+def _heuristic_field(name, ftype, prompt, required=True, validation=None):
+    field = {
+        'name': name,
+        'type': ftype,
+        'required': required,
+        'prompt': prompt,
+    }
+    if validation:
+        field['validation'] = validation
+    return field
+
+
+# Prebuilt schemas for the heuristic generator, built once at import
+_HEURISTIC_TEMPLATES = {
+    'job': ('Job Application', [
+        _heuristic_field('full_name', 'text', 'What is your full name?', True),
+        _heuristic_field('email', 'email', 'What is your email?', True),
+        _heuristic_field('years_experience', 'number', 'How many years of experience do you have?', True, {'min': 0}),
+        _heuristic_field('portfolio_url', 'text', 'What is your portfolio URL?', False),
+    ]),
+    'feedback': ('Customer Feedback', [
+        _heuristic_field('full_name', 'text', 'What is your name?', False),
+        _heuristic_field('email', 'email', 'What is your email?', False),
+        _heuristic_field('rating', 'number', 'Rate your experience from 1 to 5.', True, {'min': 1, 'max': 5}),
+        _heuristic_field('comments', 'text', 'Any comments to share?', False, {'max_length': 500}),
+    ]),
+    'custom': ('Custom Form', [
+        _heuristic_field('full_name', 'text', 'What is your name?', True),
+        _heuristic_field('email', 'email', 'What is your email?', True),
+        _heuristic_field('phone_number', 'phone', 'What is your phone number?', False),
+    ]),
+}
+
+
 class AIService:
     """Service for AI-powered voice conversation"""
     
@@ -325,6 +457,11 @@ class AIService:
             "2) clarifications with this shape:\n{\n  \"clarifying_questions\": [\"<q1>\", \"<q2>\"]\n}"
         )
 
+        cache_key = _prompt_cache_key('schema', self.text_model_id, prompt)
+        cached = _cached_response(cache_key)
+        if cached is not None:
+            return cached
+
         try:
             resp = self.client.models.generate_content(
                 model=self.text_model_id,
@@ -387,10 +524,12 @@ class AIService:
             schema_obj.setdefault('ai_prompt', "Hello! Let's get started.")
             schema_obj.setdefault('fields', [])
 
-            return {
+            result = {
                 'schema': schema_obj,
                 'clarifying_questions': clarifying_questions[:3]
             }
+            _cache_response(cache_key, result)
+            return result
         except Exception as e:
             logger.error(f"Gemini schema generation failed: {e}")
             return {
@@ -401,42 +540,21 @@ class AIService:
     def _heuristic_schema_from_desc(self, desc: str) -> Dict[str, Any]:
         """Very small heuristic generator used when Gemini is unavailable."""
         desc_l = desc.lower()
-        fields = []
-        def add_field(name, ftype, prompt, required=True, validation=None):
-            f = {
-                'name': name,
-                'type': ftype,
-                'required': required,
-                'prompt': prompt,
-            }
-            if validation:
-                f['validation'] = validation
-            fields.append(f)
 
         # Common intents
         if 'job' in desc_l or 'application' in desc_l:
-            add_field('full_name', 'text', 'What is your full name?', True)
-            add_field('email', 'email', 'What is your email?', True)
-            add_field('years_experience', 'number', 'How many years of experience do you have?', True, {'min': 0})
-            add_field('portfolio_url', 'text', 'What is your portfolio URL?', False)
-            name = 'Job Application'
+            name, fields = _HEURISTIC_TEMPLATES['job']
         elif 'feedback' in desc_l or 'survey' in desc_l:
-            add_field('full_name', 'text', 'What is your name?', False)
-            add_field('email', 'email', 'What is your email?', False)
-            add_field('rating', 'number', 'Rate your experience from 1 to 5.', True, {'min': 1, 'max': 5})
-            add_field('comments', 'text', 'Any comments to share?', False, {'max_length': 500})
-            name = 'Customer Feedback'
+            name, fields = _HEURISTIC_TEMPLATES['feedback']
         else:
-            add_field('full_name', 'text', 'What is your name?', True)
-            add_field('email', 'email', 'What is your email?', True)
-            add_field('phone_number', 'phone', 'What is your phone number?', False)
-            name = 'Custom Form'
+            name, fields = _HEURISTIC_TEMPLATES['custom']
 
         return {
             'name': name,
             'description': desc[:200],
             'ai_prompt': "Hello! I'd love to ask a few quick questions.",
-            'fields': fields
+            # Callers may edit the schema, so never hand out the shared template
+            'fields': copy.deepcopy(fields)
         }
 
     def summarize_conversation(self, conversation_history: list, max_chars: int = 600) -> str:
@@ -642,11 +760,12 @@ class AIService:
             fields = data.get('fields') or {}
             summary_text = data.get('summary_text') or self.summarize_conversation(conversation_history, max_chars=max_chars)
             confidence = int(data.get('confidence') or 0)
-            return {
+            result = {
                 'fields': fields,
                 'summary_text': summary_text,
                 'confidence': confidence
             }
+            return result
         except Exception as e:
             logger.error(f"Gemini extraction failed: {e}")
             return {
@@ -717,43 +836,8 @@ class AIService:
         Returns:
             Dict with 'is_valid' and 'error_message' keys
         """
-        field_type = field_def['type']
-        validation = field_def.get('validation', {})
-        required = field_def.get('required', False)
-        
-        # Check required
-        if required and (value is None or value == ''):
-            return {
-                'is_valid': False,
-                'error_message': 'This field is required'
-            }
-        
-        if value is None or value == '':
-            return {'is_valid': True, 'error_message': None}
-        
-        # Type-specific validation
-        if field_type == 'number':
-            try:
-                num_value = float(value)
-                if validation.get('integer_only') and not isinstance(value, int):
-                    return {'is_valid': False, 'error_message': 'Must be an integer'}
-                if 'min' in validation and num_value < validation['min']:
-                    return {'is_valid': False, 'error_message': f"Must be at least {validation['min']}"}
-                if 'max' in validation and num_value > validation['max']:
-                    return {'is_valid': False, 'error_message': f"Must be at most {validation['max']}"}
-            except (ValueError, TypeError):
-                return {'is_valid': False, 'error_message': 'Must be a number'}
-        
-        elif field_type == 'email':
-            if '@' not in str(value) or '.' not in str(value):
-                return {'is_valid': False, 'error_message': 'Invalid email format'}
-        
-        elif field_type in ['choice', 'multi_choice']:
-            options = validation.get('options', [])
-            if options and value not in options:
-                return {'is_valid': False, 'error_message': f"Must be one of: {', '.join(options)}"}
-        
-        return {'is_valid': True, 'error_message': None}
+        error_message = compile_field_validator(field_def)(value)
+        return {'is_valid': error_message is None, 'error_message': error_message}
 
 
 # Singleton instance
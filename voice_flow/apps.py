@@ -5,4 +5,7 @@ class VoiceFlowConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'voice_flow'
     verbose_name = 'Voice Flow Service'
-
+    
+    def ready(self):
+        # Register model signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,87 @@
+"""
+Caching for form configurations
+
+Form configs are read on every public form visit and WebSocket connect but
+change rarely, so they are kept in Django's cache and invalidated from the
+model signals in signals.py. A small process-local LRU sits in front of it so
+warm forms skip the cache backend round-trip and unpickling; its entries
+expire after FORM_CONFIG_LOCAL_CACHE_SECONDS so invalidations made by other
+processes are picked up quickly. Returned instances are shared and must be
+treated as read-only.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from .models import VoiceFormConfig
+
+# Process-local LRU: form_id -> (expires_at monotonic, VoiceFormConfig)
+LOCAL_FORM_CONFIG_CACHE_SIZE = 256
+_local_form_configs = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def form_config_cache_key(form_id: str) -> str:
+    """Cache key for a form configuration"""
+    return f"voice_flow:form_config:{form_id}"
+
+
+def get_form_config(form_id: str):
+    """
+    Get a form configuration, served from cache when possible
+    
+    Returns:
+        The VoiceFormConfig, or None if it does not exist
+    """
+    now = time.monotonic()
+    with _local_lock:
+        entry = _local_form_configs.get(form_id)
+        if entry is not None:
+            if entry[0] > now:
+                _local_form_configs.move_to_end(form_id)
+                return entry[1]
+            del _local_form_configs[form_id]
+    
+    key = form_config_cache_key(form_id)
+    form_config = cache.get(key)
+    if form_config is None:
+        form_config = VoiceFormConfig.objects.filter(form_id=form_id).first()
+        if form_config is None:
+            return None
+        timeout = settings.VOICE_FORM_SETTINGS.get('FORM_CONFIG_CACHE_SECONDS', 300)
+        cache.set(key, form_config, timeout)
+    
+    local_timeout = settings.VOICE_FORM_SETTINGS.get('FORM_CONFIG_LOCAL_CACHE_SECONDS', 30)
+    with _local_lock:
+        _local_form_configs[form_id] = (now + local_timeout, form_config)
+        _local_form_configs.move_to_end(form_id)
+        if len(_local_form_configs) > LOCAL_FORM_CONFIG_CACHE_SIZE:
+            _local_form_configs.popitem(last=False)
+    return form_config
+
+
+def get_active_form_config(form_id: str):
+    """
+    Get an active form configuration, served from cache when possible
+    
+    Returns:
+        The VoiceFormConfig, or None if it does not exist or is inactive
+    """
+    form_config = get_form_config(form_id)
+    if form_config is None or not form_config.is_active:
+        return None
+    return form_config
+
+
+def invalidate_form_config(form_id: str) -> None:
+    """Drop a cached form configuration"""
+    with _local_lock:
+        _local_form_configs.pop(form_id, None)
+    cache.delete(form_config_cache_key(form_id))
+
+
+def clear_local_form_configs() -> None:
+    """Empty the process-local form config cache"""
+    with _local_lock:
+        _local_form_configs.clear()
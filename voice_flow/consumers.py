@@ -1,17 +1,63 @@
 """
 WebSocket consumers for real-time voice processing
 """
+import asyncio
 import json
 import logging
+from collections import deque
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.db import transaction
 from django.utils import timezone
 from .models import MagicLinkSession, VoiceFormConfig
 from .ai_service import ai_service
 from .tasks import send_webhook
+from .cache import get_form_config
+from . import json_utils
 
 logger = logging.getLogger(__name__)
 
+# Number of recent conversation messages passed to the AI as context
+RECENT_CONTEXT_MESSAGES = 5
+
+# Incoming messages arriving within this window of the first one are coalesced
+INBOX_COALESCE_SECONDS = 0.001
+
+# Message types carrying user input; only the latest of a consecutive run is handled
+_INPUT_MESSAGE_TYPES = frozenset({'text', 'audio'})
+
+# Session data keys that come from the form config and never change mid-session
+_FORM_SNAPSHOT_KEYS = (
+    'form_id', 'form_name', 'form_description', 'ai_prompt', 'fields',
+    'fields_by_name', 'required_fields', 'total_fields', 'success_message', 'settings',
+)
+
+
+def _message_type(data):
+    return data.get('type') if isinstance(data, dict) else None
+
+
+def _coalesce_inputs(messages):
+    """
+    Drop user inputs superseded within the same burst
+    
+    Only messages that arrived within INBOX_COALESCE_SECONDS of each other are
+    passed in here. In a run of consecutive text/audio messages only the last one is kept
+    (e.g. a double-submitted or autocorrected answer); all other messages
+    pass through in order.
+    """
+    kept = []
+    for data in messages:
+        if (
+            kept
+            and _message_type(data) in _INPUT_MESSAGE_TYPES
+            and _message_type(kept[-1]) in _INPUT_MESSAGE_TYPES
+        ):
+            kept[-1] = data
+        else:
+            kept.append(data)
+    return kept
+
 
 class VoiceConversationConsumer(AsyncWebsocketConsumer):
     """
@@ -21,13 +67,16 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         """Handle WebSocket connection"""
         self.session_id = self.scope['url_route']['kwargs']['session_id']
-        self.room_group_name = f'voice_session_{self.session_id}'
         
-        # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        # Per-connection snapshot of the session, see _cache_session_data()
+        self._form_snapshot = None
+        self._session_state = None
+        self._recent_convo = deque(maxlen=RECENT_CONTEXT_MESSAGES)
+        self._remaining_required = set()
+        
+        # Incoming messages are handled in order by a single background task
+        self._inbox = asyncio.Queue()
+        self._inbox_task = asyncio.create_task(self._process_inbox())
         
         # Accept connection
         await self.accept()
@@ -36,6 +85,8 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
         try:
             session_data = await self.get_session_data()
             if session_data['is_valid']:
+                self._cache_session_data(session_data)
+                
                 # Send initial greeting
                 await self.send_message({
                     'type': 'greeting',
@@ -59,11 +110,9 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
-        # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        inbox_task = getattr(self, '_inbox_task', None)
+        if inbox_task is not None:
+            inbox_task.cancel()
     
     async def receive(self, text_data=None, bytes_data=None):
         """
@@ -76,11 +125,66 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
             "field_name": <optional field name>
         }
         """
+        if not text_data:
+            return
         try:
-            if text_data:
-                data = json.loads(text_data)
+            data = json_utils.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_message({
+                'type': 'error',
+                'message': 'Invalid message format'
+            })
+            return
+        
+        # Handling happens in _process_inbox so receive() returns immediately
+        # and bursts of input can be coalesced
+        self._inbox.put_nowait((asyncio.get_running_loop().time(), data))
+    
+    async def _process_inbox(self):
+        """
+        Handle queued messages in order, coalescing bursts of user input
+        
+        A burst is the first queued message plus whatever arrived within
+        INBOX_COALESCE_SECONDS after it. Messages that queued up later, e.g.
+        while a slow AI turn was being handled, start a new burst and are
+        never dropped.
+        """
+        loop = asyncio.get_running_loop()
+        carry = None
+        while True:
+            if carry is None:
+                arrived_at, data = await self._inbox.get()
+            else:
+                (arrived_at, data), carry = carry, None
+            batch = [data]
+            deadline = arrived_at + INBOX_COALESCE_SECONDS
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            while not self._inbox.empty():
+                item = self._inbox.get_nowait()
+                if item[0] > deadline:
+                    carry = item
+                    break
+                batch.append(item[1])
+            
+            for data in _coalesce_inputs(batch):
+                await self._dispatch(data)
+    
+    async def _dispatch(self, data):
+        """Route one incoming message to its handler"""
+        try:
+            if data:
                 message_type = data.get('type')
                 
+                if self._session_state is not None and self._session_state.get('status') == 'completed':
+                    # Nothing more to collect; never re-complete or re-send the webhook
+                    await self.send_message({
+                        'type': 'error',
+                        'message': 'Session already completed'
+                    })
+                    return
+                
                 if message_type == 'text':
                     await self.handle_text_input(data)
                 elif message_type == 'audio':
@@ -94,11 +198,6 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
                 else:
                     logger.warning(f"Unknown message type: {message_type}")
         
-        except json.JSONDecodeError:
-            await self.send_message({
-                'type': 'error',
-                'message': 'Invalid message format'
-            })
         except Exception as e:
             logger.error(f"Error processing message: {e}")
             await self.send_message({
@@ -114,7 +213,7 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
             return
         
         # Get current field
-        session_data = await self.get_session_data()
+        session_data = await self._get_cached_session_data()
         current_field = await self.get_current_field(session_data)
         
         if not current_field:
@@ -122,8 +221,9 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
             await self.handle_completion()
             return
         
-        # Save user message to conversation
-        await self.add_conversation_message('user', user_text, current_field['name'])
+        field_name = current_field['name']
+        user_message = MagicLinkSession.build_conversation_message('user', user_text, field_name)
+        self._recent_convo.append(user_message)
         
         # Process with AI
         result = await self.process_with_ai(
@@ -132,25 +232,40 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
             session_data
         )
         
-        # Save AI response to conversation
-        await self.add_conversation_message('assistant', result['ai_response'], current_field['name'])
+        # Work out completion from the in-memory state before writing
+        remaining_required = self._remaining_required
+        if result['is_valid'] and result.get('value') is not None:
+            remaining_required = remaining_required - {field_name}
+        completes = result['is_valid'] and not remaining_required
+        
+        # Persist both messages, the value and (if done) completion in one transaction
+        ai_message = MagicLinkSession.build_conversation_message('assistant', result['ai_response'], field_name)
+        completed_now, duration_seconds = await self._apply_turn(
+            messages=[user_message, ai_message],
+            field_name=field_name if result['is_valid'] else None,
+            value=result.get('value'),
+            complete=completes
+        )
+        self._recent_convo.append(ai_message)
+        self._remaining_required = remaining_required
         
         if result['is_valid']:
-            # Save the extracted value
-            await self.save_field_value(current_field['name'], result['value'])
+            collected = self._session_state['collected_data']
+            collected[field_name] = result['value']
             
             # Send success response
             await self.send_message({
                 'type': 'field_completed',
-                'field_name': current_field['name'],
+                'field_name': field_name,
                 'value': result['value'],
                 'ai_response': result['ai_response'],
-                'progress': await self.get_progress()
+                'progress': self._progress(sum(1 for v in collected.values() if v is not None))
             })
             
             # Check if all fields are completed
-            if await self.all_fields_completed():
-                await self.handle_completion()
+            if completes:
+                self._session_state['duration_seconds'] = duration_seconds
+                await self.handle_completion(already_marked=True, completed_now=completed_now)
             else:
                 # Move to next field
                 next_field = await self.get_next_field(session_data)
@@ -163,7 +278,7 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
             # Send retry message
             await self.send_message({
                 'type': 'field_retry',
-                'field_name': current_field['name'],
+                'field_name': field_name,
                 'ai_response': result['ai_response'],
                 'error': result.get('error')
             })
@@ -186,7 +301,7 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
         """Handle request to start/restart a specific field"""
         field_name = data.get('field_name')
         
-        session_data = await self.get_session_data()
+        session_data = await self._get_cached_session_data()
         field = await self.get_field_by_name(session_data, field_name)
         
         if field:
@@ -201,7 +316,7 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
         """Handle skipping a non-required field"""
         field_name = data.get('field_name')
         
-        session_data = await self.get_session_data()
+        session_data = await self._get_cached_session_data()
         field = await self.get_field_by_name(session_data, field_name)
         
         if field and not field.get('required'):
@@ -218,28 +333,80 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
             else:
                 await self.handle_completion()
     
-    async def handle_completion(self):
-        """Handle form completion"""
-        # Mark session as completed
-        await self.mark_session_completed()
+    async def handle_completion(self, already_marked=False, completed_now=True):
+        """
+        Handle form completion
         
-        # Get final data
-        session_data = await self.get_session_data()
+        The webhook is only triggered by the call that actually moved the
+        session to completed; later calls just report the completion again.
+        """
+        session_data = await self._get_cached_session_data()
+        if not session_data.get('is_valid', True):
+            return
+        
+        # Mark session as completed
+        if already_marked:
+            duration_seconds = session_data.get('duration_seconds')
+        else:
+            completed_now, duration_seconds = await self.mark_session_completed()
+            self._session_state['duration_seconds'] = duration_seconds
+        self._session_state['status'] = 'completed'
         
         # Send completion message
         await self.send_message({
             'type': 'completed',
             'message': session_data['success_message'],
             'collected_data': session_data['collected_data'],
-            'duration_seconds': session_data.get('duration_seconds')
+            'duration_seconds': duration_seconds
         })
         
         # Trigger webhook
-        await self.trigger_webhook()
+        if completed_now:
+            await self.trigger_webhook()
+    
+    def _cache_session_data(self, session_data):
+        """
+        Keep session data in memory for the lifetime of the connection
+        
+        The form config part is immutable for the session. Collected data and
+        status are updated in place alongside this consumer's own writes; other
+        writers (finalize_session_public, the live consumer) are not reflected,
+        so completion re-checks the row before marking it. Of the conversation
+        only the last few messages are kept, in _recent_convo; the full
+        transcript stays in the database.
+        """
+        self._form_snapshot = {key: session_data[key] for key in _FORM_SNAPSHOT_KEYS}
+        self._session_state = {
+            key: value for key, value in session_data.items()
+            if key not in _FORM_SNAPSHOT_KEYS and key != 'recent_messages'
+        }
+        self._recent_convo.clear()
+        self._recent_convo.extend(session_data['recent_messages'])
+        
+        # Required fields still missing a value; completion is decided from this
+        collected = session_data['collected_data']
+        self._remaining_required = {
+            name for name in session_data['required_fields']
+            if collected.get(name) is None
+        }
+    
+    def _build_session_data(self):
+        """Merge the cached form snapshot and session state"""
+        return {**self._form_snapshot, **self._session_state}
+    
+    async def _get_cached_session_data(self):
+        """Cached session data, loaded from the database on first use"""
+        if self._form_snapshot is None:
+            session_data = await self.get_session_data()
+            if not session_data['is_valid']:
+                return session_data
+            self._cache_session_data(session_data)
+        return self._build_session_data()
     
     async def send_message(self, message):
         """Send message to WebSocket"""
-        await self.send(text_data=json.dumps(message))
+        # One frame per message: clients of this consumer don't understand batch envelopes
+        await self.send(text_data=json_utils.dumps(message))
     
     # Database operations (sync to async)
     
@@ -247,9 +414,12 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
     def get_session_data(self):
         """Get session and form configuration data"""
         try:
-            session = MagicLinkSession.objects.select_related('form_config').get(
-                session_id=self.session_id
-            )
+            # The form config comes from the shared cache, so only the session
+            # row's own columns are read here, and of the transcript only the tail
+            session = MagicLinkSession.objects.only(
+                'session_id', 'form_config_id', 'status', 'expires_at',
+                'collected_data', 'session_data', 'duration_seconds'
+            ).with_recent_messages(RECENT_CONTEXT_MESSAGES).get(session_id=self.session_id)
             
             # Check if expired
             if session.is_expired():
@@ -265,7 +435,9 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
                     'error': 'Session already completed'
                 }
             
-            form_config = session.form_config
+            form_config = get_form_config(session.form_config_id)
+            if form_config is None:
+                raise MagicLinkSession.DoesNotExist
             
             return {
                 'is_valid': True,
@@ -275,12 +447,15 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
                 'form_description': form_config.description,
                 'ai_prompt': form_config.ai_prompt,
                 'fields': form_config.fields,
-                'total_fields': len(form_config.fields),
+                'fields_by_name': {f['name']: f for f in form_config.fields},
+                'required_fields': frozenset(f['name'] for f in form_config.fields if f.get('required')),
+                'total_fields': form_config.total_fields,
                 'collected_data': session.collected_data,
-                'conversation_history': session.conversation_history,
+                'recent_messages': session.recent_messages[-RECENT_CONTEXT_MESSAGES:],
                 'success_message': form_config.success_message,
                 'settings': form_config.settings,
                 'session_data': session.session_data,
+                'status': session.status,
                 'duration_seconds': session.duration_seconds
             }
         except MagicLinkSession.DoesNotExist:
@@ -289,51 +464,87 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
                 'error': 'Session not found'
             }
     
-    @database_sync_to_async
-    def add_conversation_message(self, role, content, field_name=None):
-        """Add message to conversation history"""
-        session = MagicLinkSession.objects.get(session_id=self.session_id)
-        session.add_conversation_message(role, content, field_name)
-    
-    @database_sync_to_async
-    def save_field_value(self, field_name, value):
+    async def save_field_value(self, field_name, value):
         """Save field value to session"""
-        session = MagicLinkSession.objects.get(session_id=self.session_id)
-        session.update_collected_data(field_name, value)
+        await self._save_field_value(field_name, value)
+        if self._session_state is not None:
+            self._session_state['collected_data'][field_name] = value
     
     @database_sync_to_async
-    def mark_session_completed(self):
-        """Mark session as completed"""
-        session = MagicLinkSession.objects.get(session_id=self.session_id)
-        session.mark_completed()
+    def _save_field_value(self, field_name, value):
+        MagicLinkSession.objects.filter(
+            session_id=self.session_id
+        ).set_collected_value(field_name, value)
     
     @database_sync_to_async
-    def get_progress(self):
-        """Get current progress"""
-        session = MagicLinkSession.objects.get(session_id=self.session_id)
-        return {
-            'fields_completed': session.fields_completed,
-            'total_fields': len(session.form_config.fields),
-            'percentage': session.get_completion_percentage()
-        }
+    def mark_session_completed(self):
+        """
+        Mark session as completed
+        
+        A session that is already completed is left untouched.
+        
+        Returns:
+            (completed_now, duration_seconds)
+        """
+        with transaction.atomic():
+            session = MagicLinkSession.objects.select_for_update().only(
+                'session_id', 'status', 'started_at', 'completed_at', 'duration_seconds'
+            ).get(session_id=self.session_id)
+            if session.status == 'completed':
+                return False, session.duration_seconds
+            session.mark_completed()
+            return True, session.duration_seconds
     
     @database_sync_to_async
-    def all_fields_completed(self):
-        """Check if all required fields are completed"""
-        session = MagicLinkSession.objects.get(session_id=self.session_id)
-        form_config = session.form_config
+    def _apply_turn(self, messages, field_name=None, value=None, complete=False):
+        """
+        Persist one conversation turn in a single transaction
         
-        required_fields = [f['name'] for f in form_config.fields if f.get('required')]
-        collected = session.collected_data
+        Appends the turn's messages and stores the field value (when
+        field_name is given) without reading the row. Only when the turn
+        completes the form is the row read, to mark it completed; a session
+        that is already completed is left untouched.
         
-        return all(field in collected and collected[field] is not None for field in required_fields)
+        Returns:
+            (completed_now, duration_seconds); duration is None unless complete
+        """
+        with transaction.atomic():
+            sessions = MagicLinkSession.objects.filter(session_id=self.session_id)
+            sessions.append_conversation_messages(messages)
+            if field_name is not None:
+                sessions.set_collected_value(field_name, value)
+            
+            if complete:
+                session = sessions.select_for_update().only(
+                    'session_id', 'status', 'started_at', 'completed_at', 'duration_seconds'
+                ).get()
+                if session.status == 'completed':
+                    return False, session.duration_seconds
+                session.mark_completed()
+                return True, session.duration_seconds
+        return False, None
+    
+    def _progress(self, fields_completed):
+        """Progress payload for the client"""
+        total_fields = self._form_snapshot['total_fields']
+        return {
+            'fields_completed': fields_completed,
+            'total_fields': total_fields,
+            'percentage': int((fields_completed / total_fields) * 100) if total_fields else 0
+        }
     
     @database_sync_to_async
     def trigger_webhook(self):
         """Trigger webhook delivery"""
         try:
-            session = MagicLinkSession.objects.select_related('form_config').get(session_id=self.session_id)
-            if getattr(session.form_config, 'callback_url', None):
+            if self._form_snapshot is not None:
+                form_id = self._form_snapshot['form_id']
+            else:
+                form_id = MagicLinkSession.objects.values_list(
+                    'form_config_id', flat=True
+                ).get(session_id=self.session_id)
+            form_config = get_form_config(form_id)
+            if getattr(form_config, 'callback_url', None):
                 send_webhook.delay(self.session_id)
             else:
                 logger.info(f"No callback_url configured; skipping webhook for session {self.session_id}")
@@ -341,6 +552,10 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error triggering webhook: {e}")
     
     # AI helper methods
+    #
+    # In this text consumer the AI service never calls a model (AIService.model
+    # is always None), so these return canned responses synchronously and are
+    # called inline rather than through a thread hop.
     
     async def generate_greeting(self, session_data):
         """Generate initial greeting message"""
@@ -356,33 +571,20 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
     
     async def get_next_field(self, session_data):
         """Get the next field after current"""
-        collected = session_data['collected_data']
-        found_current = False
-        
-        for field in session_data['fields']:
-            if field['name'] in collected:
-                found_current = True
-                continue
-            if found_current or field['name'] not in collected:
-                return field
-        
-        return None
+        # Fields are answered in order, so the next one is the first uncollected
+        return await self.get_current_field(session_data)
     
     async def get_field_by_name(self, session_data, field_name):
         """Get field definition by name"""
-        for field in session_data['fields']:
-            if field['name'] == field_name:
-                return field
-        return None
+        return session_data['fields_by_name'].get(field_name)
     
-    @database_sync_to_async
-    def process_with_ai(self, user_input, field_def, session_data):
+    async def process_with_ai(self, user_input, field_def, session_data):
         """Process user input with AI"""
-        conversation_context = json.dumps(session_data['conversation_history'][-5:])
+        # Serialize the (at most five message) context on the event loop
+        conversation_context = json_utils.dumps(list(self._recent_convo))
         return ai_service.process_user_input(user_input, field_def, conversation_context)
     
-    @database_sync_to_async
-    def generate_field_prompt(self, field, session_data):
+    async def generate_field_prompt(self, field, session_data):
         """Generate AI prompt for a field"""
         prompt = ai_service.generate_conversation_prompt(
             {
@@ -392,7 +594,7 @@ class VoiceConversationConsumer(AsyncWebsocketConsumer):
             },
             field,
             session_data['collected_data'],
-            session_data['conversation_history']
+            list(self._recent_convo)
         )
         return ai_service.generate_ai_message(prompt)
 
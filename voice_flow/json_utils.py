@@ -0,0 +1,41 @@
+"""
+JSON helpers backed by orjson when it is installed
+"""
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def canonical_json(payload) -> bytes:
+    """
+    Serialize a payload to compact, key-sorted UTF-8 JSON
+    
+    This is the webhook body and the byte string its signature is computed
+    over. It always uses the stdlib encoder: orjson formats some floats
+    differently (1e16 vs 1e+16) and rejects integers outside 64 bits, so the
+    bytes would depend on whether orjson happens to be installed.
+    """
+    return json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj) -> str:
+    """Serialize an object to a compact JSON string"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def loads(data):
+    """
+    Parse JSON from str or bytes
+    
+    Raises json.JSONDecodeError on invalid input (orjson's error subclasses it).
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
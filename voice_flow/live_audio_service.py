@@ -7,6 +7,7 @@ import logging
 from typing import Dict, Any, Optional
 from django.conf import settings
 from google import genai
+from . import json_utils
 
 logger = logging.getLogger(__name__)
 
@@ -255,11 +256,10 @@ class GeminiLiveAudioService:
             async for response in turn:
                 if text := response.text:
                     # Parse JSON response
-                    import json
                     try:
-                        parsed = json.loads(text)
+                        parsed = json_utils.loads(text)
                         result.update(parsed)
-                    except json.JSONDecodeError:
+                    except ValueError:
                         # If not JSON, treat as message
                         result['message'] = text
         
@@ -3,19 +3,53 @@ WebSocket consumer for Gemini Live API bidirectional audio streaming
 Follows Google's reference implementation exactly
 """
 import asyncio
-import json
 import logging
+import re
 import sys
+from collections import deque
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from .models import MagicLinkSession
 from .tasks import send_webhook
 from .ai_service import ai_service
+from .cache import get_form_config
+from . import json_utils
 
 logger = logging.getLogger(__name__)
 
+# Browser audio chunks already queued are merged into one realtime send, up to this many
+MAX_AUDIO_CHUNKS_PER_SEND = 8
+
+# Gemini audio chunks buffered for a slow browser before the oldest are dropped
+MAX_BROWSER_AUDIO_BACKLOG = 256
+
+# Buffered Gemini audio is merged into one browser frame, up to this many bytes
+MAX_BROWSER_AUDIO_FRAME_BYTES = 16 * 1024
+
+# Most recent conversation entries handed to the AI helpers at completion
+# (the full transcript is still saved)
+MAX_AI_HISTORY_ENTRIES = 64
+
+# Built system instructions keyed by (form_id, updated_at), oldest evicted first
+MAX_CACHED_SYSTEM_INSTRUCTIONS = 256
+_system_instructions = {}
+
+# Phrases in the assistant's speech that mean the survey is over ("complere" is a common typo)
+_COMPLETION_PHRASE_RE = re.compile(
+    r"survey compl(?:ete|ere)|thank you! survey|that completes|all done",
+    re.IGNORECASE
+)
+
+# Fixed envelopes for frequent control messages; only the variable parts are encoded
+_ERROR_PREFIX = '{"type":"error","message":'
+_TRANSCRIPT_PREFIX = '{"type":"transcript","text":'
+_TRANSCRIPT_SUFFIX = ',"speaker":"assistant"}'
+_PROGRESS_TEMPLATE = '{"type":"progress","current_field":%d,"total_fields":%d,"percentage":%d}'
+
 # For Python < 3.11 compatibility
 if sys.version_info < (3, 11, 0):
     try:
@@ -33,6 +67,33 @@ except ImportError:
     logger.error("google-genai not installed")
 
 
+# Gemini client shared by every live session in this worker process
+_genai_client = None
+
+
+def _get_genai_client():
+    """Return the shared Gemini client, creating it on first use"""
+    global _genai_client
+    if _genai_client is None:
+        api_key = settings.VOICE_FORM_SETTINGS.get('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not set")
+        _genai_client = genai.Client(
+            api_key=api_key,
+            http_options={"api_version": "v1alpha"}
+        )
+    return _genai_client
+
+
+def _normalize_call(fc):
+    """Return a {'name': str, 'args': dict} item for an SDK call object, or None if it has no name"""
+    name = getattr(fc, 'name', None) or getattr(fc, 'function', None)
+    if not name:
+        return None
+    args = getattr(fc, 'args', None) or getattr(fc, 'parameters', None) or {}
+    return {'name': name, 'args': args if isinstance(args, dict) else {}}
+
+
 class LiveAudioConsumer(AsyncWebsocketConsumer):
     """
     Gemini 2.5 Flash Live API WebSocket Consumer
@@ -46,14 +107,25 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         """Handle WebSocket connection"""
         self.session_id = self.scope['url_route']['kwargs']['session_id']
-        self.audio_in_queue = None  # Audio from Gemini to client
+        self._loop = asyncio.get_running_loop()  # Clock source for the silence detector
+        self._debug = logger.isEnabledFor(logging.DEBUG)  # Per-frame debug logging, checked once
+        self.audio_in_buffer = None  # Audio from Gemini to client
+        self.audio_in_ready = None  # Set when audio_in_buffer has data
         self.audio_out_queue = None  # Audio from client to Gemini
         self.gemini_session = None
         self.form_config = None
+        self._session = None  # MagicLinkSession loaded on connect, reused for writes
+        self._total_fields = 0  # Field count of the form, fixed for the session
         self.main_task = None
-        self.conversation_history = []  # Track conversation
+        self.conversation_history = []  # Full transcript, saved on completion
+        self._assistant_text = []  # Streamed assistant text for the current turn
+        self._has_user_msg = False  # Set once the user has said anything
+        self._completion_task = None  # Latest background completion run
+        self._completed_state = None  # _completion_state() when completion last ran
+        self._saved_collected_data = None  # collected_data as last written by completion
         self.current_field_index = 0  # Track which field we're on
         self.collected_data = {}  # Store responses
+        self._fields_completed = 0  # Non-null values in collected_data
         # Server-side silence detection state
         self._silence_threshold_abs = 120  # average absolute amplitude threshold (16-bit)
         self._silence_timeout_ms = 6500
@@ -70,23 +142,18 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
         await self.accept()
         
         if not GENAI_AVAILABLE:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': 'google-genai not installed'
-            }))
+            await self.send_error('google-genai not installed')
             return
         
         # Get session data
         try:
             session_data = await self.get_session_data()
             if not session_data['is_valid']:
-                await self.send(text_data=json.dumps({
-                    'type': 'error',
-                    'message': session_data.get('error', 'Invalid session')
-                }))
+                await self.send_error(session_data.get('error', 'Invalid session'))
                 return
             
             self.form_config = session_data
+            self._total_fields = session_data['total_fields']
             
             # Start the Live API loop (this will run continuously)
             self.main_task = asyncio.create_task(self.run_live_api())
@@ -95,31 +162,35 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
             
         except Exception as e:
             logger.error(f"Connection error: {e}", exc_info=True)
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': str(e)
-            }))
+            await self.send_error(str(e))
     
     async def disconnect(self, close_code):
         """Handle disconnection"""
         logger.info(f"Disconnecting session {self.session_id}")
         if self.main_task:
             self.main_task.cancel()
+        if self._completion_task is not None:
+            # Save anything that arrived after completion ran, and don't let the
+            # consumer go away while a completion is still writing
+            try:
+                await asyncio.shield(self.schedule_completion())
+            except Exception as e:
+                logger.error(f"Error finishing completion on disconnect: {e}")
     
     async def receive(self, text_data=None, bytes_data=None):
         """Receive from browser"""
         try:
             if bytes_data and self.audio_out_queue:
                 # Audio from browser - send to Gemini
-                logger.debug(f"Received {len(bytes_data)} bytes from browser")
+                if self._debug:
+                    logger.debug("Received %d bytes from browser", len(bytes_data))
                 # Update silence detector (RMS over 16-bit PCM)
                 try:
-                    from array import array
-                    pcm = array('h')
-                    pcm.frombytes(bytes_data)
+                    # Zero-copy view of the frame as native 16-bit samples
+                    pcm = memoryview(bytes_data).cast('h')
                     if pcm:
                         avg_abs = sum(1 if v == -32768 else abs(v) for v in pcm) / len(pcm)
-                        now = asyncio.get_running_loop().time()
+                        now = self._loop.time()
                         if avg_abs >= self._silence_threshold_abs:
                             self._last_sound_monotonic = now
                             self._speech_detected = True
@@ -128,43 +199,45 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
                         elif self._last_sound_monotonic is None:
                             self._last_sound_monotonic = now
                 except Exception as e:
-                    logger.debug(f"Silence detector error (ignored): {e}")
-                await self.audio_out_queue.put({
-                    "data": bytes_data,
-                    "mime_type": "audio/pcm"
-                })
+                    logger.debug("Silence detector error (ignored): %s", e)
+                # Never block the receive loop on a slow Gemini session: drop the oldest chunk instead
+                try:
+                    self.audio_out_queue.put_nowait(bytes_data)
+                except asyncio.QueueFull:
+                    self.audio_out_queue.get_nowait()
+                    self.audio_out_queue.put_nowait(bytes_data)
+                    if self._debug:
+                        logger.debug("Gemini send queue full, dropped oldest audio chunk")
             elif text_data:
                 # Control message
-                data = json.loads(text_data)
-                logger.debug(f"Control message: {data.get('type')}")
+                data = json_utils.loads(text_data)
+                logger.debug("Control message: %s", data.get('type'))
                 if data.get('type') == 'start':
                     logger.info("Client ready to start conversation")
                 elif data.get('type') == 'user_transcript':
                     # Track user's speech 
                     user_text = data.get('text', '')
+                    self._flush_assistant_text()
                     self.conversation_history.append({'role': 'user', 'text': user_text})
+                    self._has_user_msg = True
                 elif data.get('type') == 'manual_complete':
                     # Manual completion trigger from UI
                     logger.info("Manual completion triggered by user")
-                    await self.handle_completion()
+                    self.schedule_completion()
         except Exception as e:
             logger.error(f"Receive error: {e}", exc_info=True)
     
+    async def send_error(self, message):
+        """Send an error message to the browser"""
+        await self.send(text_data=_ERROR_PREFIX + json_utils.dumps(str(message)) + '}')
+    
     async def run_live_api(self):
         """
         Main Live API loop - follows Google's reference pattern exactly
         This runs continuously with async with and TaskGroup
         """
         try:
-            api_key = settings.VOICE_FORM_SETTINGS.get('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY not set")
-            
-            # Create Gemini client
-            client = genai.Client(
-                api_key=api_key,
-                http_options={"api_version": "v1alpha"}
-            )
+            client = _get_genai_client()
             
             # Build system instruction
             system_instruction = self.build_system_instruction()
@@ -213,7 +286,10 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
                 }
             }
             
-            model = "gemini-2.5-flash-native-audio-preview-09-2025"
+            model = settings.VOICE_FORM_SETTINGS.get(
+                'GEMINI_AUDIO_MODEL',
+                'gemini-2.5-flash-native-audio-preview-09-2025'
+            )
             
             logger.info(f"Connecting to {model}")
             
@@ -225,17 +301,19 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
                 self.gemini_session = session
                 
                 # Initialize queues
-                self.audio_in_queue = asyncio.Queue()  # Gemini → Browser
+                # Gemini → Browser; a full buffer drops its oldest chunk
+                self.audio_in_buffer = deque(maxlen=MAX_BROWSER_AUDIO_BACKLOG)
+                self.audio_in_ready = asyncio.Event()
                 self.audio_out_queue = asyncio.Queue(maxsize=5)  # Browser → Gemini
                 
                 logger.info("Live API connected!")
                 
                 # Send ready message to browser
-                await self.send(text_data=json.dumps({
+                await self.send(text_data=json_utils.dumps({
                     'type': 'ready',
                     'message': 'Live API connected. Click microphone to start!',
                     'form_name': self.form_config['form_name'],
-                    'total_fields': self.form_config['total_fields']
+                    'total_fields': self._total_fields
                 }))
                 
                 # Start all tasks (pattern from reference code)
@@ -250,97 +328,114 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
             logger.info("Live API loop cancelled")
         except Exception as e:
             logger.error(f"Live API error: {e}", exc_info=True)
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': f"Live API error: {str(e)}"
-            }))
+            await self.send_error(f"Live API error: {str(e)}")
     
     async def send_realtime(self):
         """Send audio from browser to Gemini (from reference code)"""
         logger.info("Ready to send audio to Gemini...")
+        # Bound once; these run for every audio frame
+        queue = self.audio_out_queue
+        send_realtime_input = self.gemini_session.send_realtime_input
+        debug = self._debug
         try:
             while True:
-                msg = await self.audio_out_queue.get()
-                logger.debug(f"Sending audio to Gemini: {len(msg['data'])} bytes")
-                await self.gemini_session.send_realtime_input(audio=msg)
+                data = await queue.get()
+                # Drain whatever else is already waiting so a backlog goes out in one frame
+                if not queue.empty():
+                    chunks = [data]
+                    while len(chunks) < MAX_AUDIO_CHUNKS_PER_SEND and not queue.empty():
+                        chunks.append(queue.get_nowait())
+                    data = b"".join(chunks)
+                if debug:
+                    logger.debug("Sending audio to Gemini: %d bytes", len(data))
+                await send_realtime_input(audio={"data": data, "mime_type": "audio/pcm"})
         except Exception as e:
             logger.error(f"Error sending to Gemini: {e}", exc_info=True)
     
     async def receive_audio_from_gemini(self):
         """Receive audio from Gemini (from reference code)"""
         logger.info("Starting to receive audio from Gemini...")
+        # Bound once; these run for every audio chunk
+        session = self.gemini_session
+        audio_buffer = self.audio_in_buffer
+        audio_ready = self.audio_in_ready
+        clock = self._loop.time
+        debug = self._debug
         try:
             while True:
-                turn = self.gemini_session.receive()
+                turn = session.receive()
                 async for response in turn:
                     if data := response.data:
-                        # Put audio in queue to send to browser
-                        logger.debug(f"Received {len(data)} bytes of audio from Gemini")
-                        try:
-                            self._last_ai_audio_monotonic = asyncio.get_running_loop().time()
-                        except Exception:
-                            pass
-                        self.audio_in_queue.put_nowait(data)
+                        # Buffer audio for the browser sender. If the browser is not
+                        # keeping up, the deque drops the oldest (stalest) chunk.
+                        if debug:
+                            logger.debug("Received %d bytes of audio from Gemini", len(data))
+                        self._last_ai_audio_monotonic = clock()
+                        audio_buffer.append(data)
+                        audio_ready.set()
                         continue
                     
-                    # Debug: Log the entire response structure
-                    logger.info(f"Response type: {type(response)}")
-                    logger.info(f"Response attributes: {dir(response)}")
-                    
                     # Check response.text first (may be absent in audio-only mode)
                     text_content = None
                     if text := response.text:
                         text_content = text
-                        logger.info(f"Found text in response.text: {text_content}")
+                        logger.debug("Found text in response.text: %s", text_content)
                     
                     # Check server_content as fallback (Gemini sends text here!)
-                    if hasattr(response, 'server_content') and response.server_content:
-                        sc = response.server_content
-                        logger.info(f"server_content type: {type(sc)}")
+                    sc = getattr(response, 'server_content', None)
+                    if not (text_content or sc or getattr(response, 'tool_call', None)):
+                        # Nothing to show or act on (setup ack, usage metadata, ...)
+                        continue
+                    # Control frames produced by this message go out together
+                    frames = []
+                    if sc:
+                        logger.debug("server_content type: %s", type(sc))
                         
                         # Check turn_complete status
-                        if hasattr(sc, 'turn_complete'):
-                            logger.info(f"turn_complete: {sc.turn_complete}")
+                        turn_complete = getattr(sc, 'turn_complete', None)
+                        if turn_complete is not None:
+                            logger.debug("turn_complete: %s", turn_complete)
                         
                         # Try model_turn
-                        if hasattr(sc, 'model_turn'):
-                            mt = sc.model_turn
-                            logger.info(f"model_turn: {mt} (type: {type(mt)})")
+                        mt = getattr(sc, 'model_turn', None)
+                        if mt:
+                            logger.debug("model_turn: %s (type: %s)", mt, type(mt))
                             
-                            if mt and hasattr(mt, 'parts'):
-                                logger.info(f"model_turn.parts: {len(mt.parts)} parts")
-                                for i, part in enumerate(mt.parts):
-                                    logger.info(f"Part {i}: {type(part)}")
+                            parts = getattr(mt, 'parts', None)
+                            if parts:
+                                logger.debug("model_turn.parts: %d parts", len(parts))
+                                for i, part in enumerate(parts):
+                                    logger.debug("Part %d: %s", i, type(part))
                                     # Try to get text from part
-                                    if hasattr(part, 'text'):
-                                        text_content = part.text
-                                        logger.info(f"✅ FOUND TEXT: {text_content}")
+                                    part_text = getattr(part, 'text', None)
+                                    if part_text:
+                                        text_content = part_text
+                                        logger.debug("Found text in model_turn part: %s", text_content)
                                         break
-                                    elif hasattr(part, 'inline_data'):
-                                        logger.info(f"Part {i} has inline_data (audio)")
+                                    elif getattr(part, 'inline_data', None):
+                                        logger.debug("Part %d has inline_data (audio)", i)
                         
                         # Try output_transcription as alternative
-                        if not text_content and hasattr(sc, 'output_transcription'):
-                            ot = sc.output_transcription
-                            logger.info(f"output_transcription: {ot}")
+                        if not text_content:
+                            ot = getattr(sc, 'output_transcription', None)
+                            logger.debug("output_transcription: %s", ot)
                             if ot:
-                                text_content = ot
+                                text_content = getattr(ot, 'text', ot)
                     
                     if text_content:
                         # Log and send transcript
-                        logger.info(f"Gemini says: {text_content}")
-                        self.conversation_history.append({'role': 'assistant', 'text': text_content})
+                        logger.debug("Gemini says: %s", text_content)
+                        self._assistant_text.append(text_content)
                         
-                        await self.send(text_data=json.dumps({
-                            'type': 'transcript',
-                            'text': text_content,
-                            'speaker': 'assistant'
-                        }))
+                        frames.append(
+                            _TRANSCRIPT_PREFIX + json_utils.dumps(text_content) + _TRANSCRIPT_SUFFIX
+                        )
                         
                         # Check if survey is complete
                         if self.is_survey_complete(text_content):
                             logger.info(f"Survey completion detected in text: {text_content}")
-                            await self.handle_completion()
+                            await self._send_frames(frames)
+                            self.schedule_completion()
 
                     # Handle tool calls (structured extraction without transcripts) pass summary text from the arguments here to text llm then to front end
                     try:
@@ -355,25 +450,31 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
                                 field_name = self._get_ci(args, 'field_name', 'fieldName', 'name')
                                 value = args.get('value')
                                 if field_name:
+                                    previous = self.collected_data.get(field_name)
                                     self.collected_data[field_name] = value
+                                    self._fields_completed += (value is not None) - (previous is not None)
                                     # Update progress to client (best-effort)
-                                    await self.send(text_data=json.dumps({
-                                        'type': 'progress',
-                                        'current_field': len([v for v in self.collected_data.values() if v is not None]),
-                                        'total_fields': self.form_config.get('total_fields', 0),
-                                        'percentage': int(100 * len([v for v in self.collected_data.values() if v is not None]) / max(self.form_config.get('total_fields', 1), 1))
-                                    }))
+                                    completed = self._fields_completed
+                                    total_fields = self._total_fields
+                                    frames.append(_PROGRESS_TEMPLATE % (
+                                        completed,
+                                        total_fields,
+                                        int(100 * completed / (total_fields or 1))
+                                    ))
 
                             elif name == 'submit_form_summary' and isinstance(args, dict):
                                 summary_text = self._get_ci(args, 'summary_text', 'summaryText', 'summary') or ''
                                 fc_json_text = self._get_ci(args, 'function_call_json_text', 'functionCallJsonText', 'json', 'payload') or '{}'
                                 try:
-                                    parsed = json.loads(fc_json_text)
+                                    parsed = json_utils.loads(fc_json_text)
                                     if isinstance(parsed, dict):
                                         self.collected_data.update(parsed)
+                                        self._fields_completed = sum(
+                                            1 for v in self.collected_data.values() if v is not None
+                                        )
                                 except Exception:
                                     logger.warning("submit_form_summary function_call_json_text was not valid JSON")
-                                await self.send(text_data=json.dumps({
+                                frames.append(json_utils.dumps({
                                     'type': 'summary_submitted',
                                     'summary': summary_text,
                                     'extracted_fields': self.collected_data
@@ -385,41 +486,77 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
 
                             elif name == 'complete_form':
                                 # Prevent premature completion before any user input or extracted fields
-                                try:
-                                    has_user_msg = any((m.get('role') == 'user') for m in self.conversation_history)
-                                except Exception:
-                                    has_user_msg = False
-                                if has_user_msg or (self.collected_data and len(self.collected_data) > 0):
-                                    await self.handle_completion()
+                                if self._has_user_msg or self.collected_data:
+                                    await self._send_frames(frames)
+                                    self.schedule_completion()
                                 else:
                                     logger.info("Ignored early complete_form call (no user input or fields yet)")
                     except Exception as e:
                         logger.error(f"Error handling tool call: {e}")
+                    
+                    await self._send_frames(frames)
                 
                 logger.debug("Turn complete")
+                self._flush_assistant_text()
                 
                 # Handle interruptions - clear queue (from reference code)
-                while not self.audio_in_queue.empty():
-                    self.audio_in_queue.get_nowait()
+                audio_buffer.clear()
         except Exception as e:
             logger.error(f"Error receiving from Gemini: {e}", exc_info=True)
     
+    async def _send_frames(self, frames):
+        """
+        Send encoded control frames as one WebSocket message
+        
+        A single frame is sent as-is; several are wrapped in a
+        {"type": "batch", "messages": [...]} envelope. The list is emptied.
+        """
+        if not frames:
+            return
+        if len(frames) == 1:
+            await self.send(text_data=frames[0])
+        else:
+            await self.send(text_data='{"type":"batch","messages":[' + ','.join(frames) + ']}')
+        frames.clear()
+    
+    def _flush_assistant_text(self):
+        """Record the text streamed for the current assistant turn as one history entry"""
+        if self._assistant_text:
+            self.conversation_history.append({'role': 'assistant', 'text': ''.join(self._assistant_text)})
+            self._assistant_text.clear()
+    
     async def send_audio_to_browser(self):
         """Send audio from queue to browser"""
         logger.info("Ready to send audio to browser...")
+        buffer = self.audio_in_buffer
+        ready = self.audio_in_ready
+        send = self.send
+        debug = self._debug
         try:
             while True:
-                audio_data = await self.audio_in_queue.get()
-                logger.debug(f"Sending {len(audio_data)} bytes to browser")
-                # Send as binary WebSocket message
-                await self.send(bytes_data=audio_data)
+                await ready.wait()
+                ready.clear()
+                # Chunks appended while we are sending set the event again
+                while buffer:
+                    audio_data = buffer.popleft()
+                    if buffer and len(audio_data) < MAX_BROWSER_AUDIO_FRAME_BYTES:
+                        # Merge contiguous PCM that is already waiting; the player
+                        # treats consecutive frames as one stream anyway
+                        frame = bytearray(audio_data)
+                        while buffer and len(frame) + len(buffer[0]) <= MAX_BROWSER_AUDIO_FRAME_BYTES:
+                            frame += buffer.popleft()
+                        audio_data = bytes(frame)
+                    if debug:
+                        logger.debug("Sending %d bytes to browser", len(audio_data))
+                    # Send as binary WebSocket message
+                    await send(bytes_data=audio_data)
         except Exception as e:
             logger.error(f"Error sending to browser: {e}", exc_info=True)
     
     async def _monitor_silence(self):
         """Monitor incoming audio and auto-complete after sustained silence."""
         try:
-            loop = asyncio.get_running_loop()
+            loop = self._loop
             while True:
                 await asyncio.sleep(0.25)
                 if self._silence_monitor_triggered:
@@ -445,10 +582,8 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
                         await asyncio.wait_for(self._summary_event.wait(), timeout=2.0)
                     except asyncio.TimeoutError:
                         pass
-                    try:
-                        await self.handle_completion()
-                    except Exception as e:
-                        logger.error(f"Error during auto-completion: {e}")
+                    # Not awaited: cancelling this monitor must not cancel completion
+                    self.schedule_completion()
                     break
         except asyncio.CancelledError:
             pass
@@ -483,37 +618,35 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
                 fc_list = getattr(tc, 'function_calls', None) or getattr(tc, 'tool_calls', None)
                 if fc_list and isinstance(fc_list, (list, tuple)):
                     for fc in fc_list:
-                        name = getattr(fc, 'name', None) or getattr(fc, 'function', None)
-                        args = getattr(fc, 'args', None) or getattr(fc, 'parameters', None) or {}
-                        if name:
-                            calls.append({'name': name, 'args': args if isinstance(args, dict) else {}})
+                        call = _normalize_call(fc)
+                        if call:
+                            calls.append(call)
                 else:
-                    name = getattr(tc, 'name', None) or getattr(tc, 'function', None)
-                    args = getattr(tc, 'args', None) or getattr(tc, 'parameters', None) or {}
-                    if name:
-                        calls.append({'name': name, 'args': args if isinstance(args, dict) else {}})
+                    call = _normalize_call(tc)
+                    if call:
+                        calls.append(call)
 
             # Plural attributes directly on response
             for attr in ('function_calls', 'tool_calls'):
                 fc_list = getattr(response, attr, None)
                 if fc_list and isinstance(fc_list, (list, tuple)):
                     for fc in fc_list:
-                        name = getattr(fc, 'name', None) or getattr(fc, 'function', None)
-                        args = getattr(fc, 'args', None) or getattr(fc, 'parameters', None) or {}
-                        if name:
-                            calls.append({'name': name, 'args': args if isinstance(args, dict) else {}})
+                        call = _normalize_call(fc)
+                        if call:
+                            calls.append(call)
 
             # server_content.model_turn.parts nested function/tool calls
             sc = getattr(response, 'server_content', None)
-            if sc and hasattr(sc, 'model_turn') and getattr(sc.model_turn, 'parts', None):
-                for part in sc.model_turn.parts:
+            mt = getattr(sc, 'model_turn', None) if sc else None
+            parts = getattr(mt, 'parts', None) if mt else None
+            if parts:
+                for part in parts:
                     for cand_attr in ('function_call', 'tool_call'):
                         fc = getattr(part, cand_attr, None)
                         if fc:
-                            name = getattr(fc, 'name', None) or getattr(fc, 'function', None)
-                            args = getattr(fc, 'args', None) or getattr(fc, 'parameters', None) or {}
-                            if name:
-                                calls.append({'name': name, 'args': args if isinstance(args, dict) else {}})
+                            call = _normalize_call(fc)
+                            if call:
+                                calls.append(call)
                     name = getattr(part, 'name', None) or getattr(part, 'function', None)
                     if name and (hasattr(part, 'args') or hasattr(part, 'parameters')):
                         args = getattr(part, 'args', None) or getattr(part, 'parameters', None) or {}
@@ -530,15 +663,23 @@ class LiveAudioConsumer(AsyncWebsocketConsumer):
         return calls
 
     def build_system_instruction(self):
-        """Build system instruction for form"""
+        """Build system instruction for form, reusing it until the form is edited"""
+        key = (self.form_config['form_id'], self.form_config.get('updated_at'))
+        instruction = _system_instructions.get(key)
+        if instruction is None:
+            instruction = self._render_system_instruction()
+            if len(_system_instructions) >= MAX_CACHED_SYSTEM_INSTRUCTIONS:
+                del _system_instructions[next(iter(_system_instructions))]
+            _system_instructions[key] = instruction
+        return instruction
+    
+    def _render_system_instruction(self):
+        """Render the system instruction text for the current form"""
         fields = self.form_config['fields']
-        field_list = []
-        
-        for i, field in enumerate(fields, 1):
-            req = "REQUIRED" if field.get('required') else "optional"
-            field_list.append(
-                f"{i}. {field['name']} ({field['type']}, {req}): {field['prompt']}"
-            )
+        field_list = "\n".join(
+            f"{i}. {field['name']} ({field['type']}, {'REQUIRED' if field.get('required') else 'optional'}): {field['prompt']}"
+            for i, field in enumerate(fields, 1)
+        )
         
         # Get first question
         first_field = fields[0] if fields else None
@@ -551,7 +692,7 @@ PRIMARY GOAL:
 - Prefer a single summary-first submission at the end via submit_form_summary.
 
 AVAILABLE QUESTIONS (use them as guidance, but keep it conversational):
-{chr(10).join(field_list)}
+{field_list}
 
 START NOW by saying ONLY this opening line:
 "{self.form_config.get('ai_prompt', 'Hello!')} {first_prompt}"
@@ -573,32 +714,72 @@ LEGACY FALLBACK (only if necessary):
     def is_survey_complete(self, text):
         """Check if survey is complete based on Gemini's response"""
         # Check for completion phrases
-        text_lower = text.lower()
-        completion_phrases = [
-            'survey complete',
-            'survey complere',  # typo handling
-            'thank you! survey',
-            'that completes',
-            'all done'
-        ]
-        is_complete = any(phrase in text_lower for phrase in completion_phrases)
+        is_complete = _COMPLETION_PHRASE_RE.search(text) is not None
         if is_complete:
             logger.info(f"✅ COMPLETION PHRASE DETECTED: '{text}'")
         return is_complete
     
-    async def handle_completion(self):
-        """Handle survey completion"""
+    def _completion_state(self):
+        """What completion saves: transcript length (incl. pending assistant text) and collected data"""
+        return (len(self.conversation_history) + bool(self._assistant_text), dict(self.collected_data))
+    
+    def schedule_completion(self):
+        """
+        Start survey completion in the background
+        
+        Completion can be triggered by the completion phrase, complete_form,
+        the silence monitor or the user. The first trigger completes the
+        session; a later trigger (or disconnect) re-saves it once more, after
+        the previous run, if the transcript or collected data changed since,
+        e.g. when the completion phrase matched early. Otherwise the current
+        task is returned. Running it as its own task keeps the Gemini receive
+        loop and the browser socket responsive meanwhile.
+        """
+        task = self._completion_task
+        if task is None:
+            self._completed_state = self._completion_state()
+            self._completion_task = asyncio.create_task(self.handle_completion())
+        elif self._completion_state() != self._completed_state:
+            self._completed_state = self._completion_state()
+            self._completion_task = asyncio.create_task(self._resave_completion(task))
+        return self._completion_task
+    
+    async def _resave_completion(self, previous):
+        """Re-save a completed session once the previous completion run has finished"""
+        try:
+            await previous
+        except Exception:
+            pass
+        await self.handle_completion(final=False)
+    
+    async def handle_completion(self, final=True):
+        """
+        Handle survey completion
+        
+        The final run marks the session completed, queues the webhook and
+        tells the browser; a re-save (final=False) only updates the saved
+        transcript, summary and collected data.
+        """
         try:
             logger.info(f"Survey completed for session {self.session_id}")
+            self._flush_assistant_text()
+            # Full snapshot to save; the AI helpers only look at the recent tail
+            history = list(self.conversation_history)
+            ai_history = history[-MAX_AI_HISTORY_ENTRIES:]
             
-            # Save conversation history as collected data
-            await self.save_conversation()
-            
-            # Extract structured fields + summary via Gemini (Option B)
-            extraction = ai_service.extract_structured_from_conversation(
-                self.form_config.get('fields', []),
-                self.conversation_history
-            )
+            # Extract structured fields + summary via Gemini (Option B).
+            # These are blocking HTTP calls, so they run off the event loop.
+            # A failure here must not stop the transcript from being saved below.
+            try:
+                extraction = await sync_to_async(
+                    ai_service.extract_structured_from_conversation, thread_sensitive=False
+                )(
+                    self.form_config.get('fields', []),
+                    ai_history
+                )
+            except Exception as e:
+                logger.warning(f"Structured extraction failed: {e}")
+                extraction = {}
             summary = extraction.get('summary_text')
             extracted_fields = extraction.get('fields') or {}
 
@@ -612,9 +793,9 @@ LEGACY FALLBACK (only if necessary):
                         pairs = [f"{k}: {extracted_fields.get(k)}" for k in extracted_fields.keys()]
                         summary = "; ".join(pairs)
                     except Exception:
-                        summary = ai_service.summarize_conversation(self.conversation_history)
+                        summary = ai_service.summarize_conversation(ai_history)
                 else:
-                    summary = ai_service.summarize_conversation(self.conversation_history)
+                    summary = ai_service.summarize_conversation(ai_history)
             
             # Merge with values captured via tool calls. Prefer non-null from collected_data
             if self.collected_data:
@@ -633,86 +814,88 @@ LEGACY FALLBACK (only if necessary):
                     self.collected_data.update(extracted_fields)
             except Exception:
                 pass
+            # What this run saves; later changes trigger a re-save. The merge
+            # above changes collected_data, so this is recorded only now.
+            self._completed_state = (len(history), dict(self.collected_data))
 
             # Build a friendly AI-generated summary from merged fields when available,
             # otherwise fall back to conversation-based summary.
             try:
                 if extracted_fields:
-                    summary = ai_service.summarize_fields(
+                    summary = await sync_to_async(ai_service.summarize_fields, thread_sensitive=False)(
                         extracted_fields,
                         form_title=self.form_config.get('form_name')
                     )
                 if not summary:
-                    summary = ai_service.summarize_conversation(self.conversation_history)
+                    summary = ai_service.summarize_conversation(ai_history)
             except Exception:
-                summary = ai_service.summarize_conversation(self.conversation_history)
-
-            # Persist summary for this session
-            try:
-                await self.save_summary_text(summary)
-            except Exception as e:
-                logger.warning(f"Failed to save summary_text: {e}")
+                summary = ai_service.summarize_conversation(ai_history)
 
-            # Mark session as completed
-            await self.mark_session_completed()
+            # Persist transcript, summary and completion, and queue the webhook
+            await self.finalize_session(history, summary, final=final)
+            if not final:
+                return
             
             # Send completion message
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=json_utils.dumps({
                 'type': 'completed',
                 'message': self.form_config.get('success_message', 'Thank you! Survey completed.'),
-                'conversation': self.conversation_history,
                 'summary': summary,
                 'extracted_fields': extracted_fields,
                 'confidence': extraction.get('confidence', 0)
             }))
-            
-            # Trigger webhook
-            await self.trigger_webhook()
         except Exception as e:
             logger.error(f"Error in handle_completion: {e}", exc_info=True)
     
-    @database_sync_to_async
-    def save_conversation(self):
-        """Save conversation history to database"""
-        try:
-            session = MagicLinkSession.objects.get(session_id=self.session_id)
-            session.conversation_history = self.conversation_history
-            session.save()
-        except Exception as e:
-            logger.error(f"Error saving conversation: {e}")
+    def _get_session(self):
+        """Return the session loaded on connect, fetching it if connect did not"""
+        if self._session is None:
+            self._session = MagicLinkSession.objects.select_related('form_config').get(
+                session_id=self.session_id
+            )
+        return self._session
 
     @database_sync_to_async
-    def save_summary_text(self, summary):
-        """Save LLM summary to the session."""
-        try:
-            session = MagicLinkSession.objects.get(session_id=self.session_id)
-            session.summary_text = summary or ''
-            session.save(update_fields=['summary_text'])
-        except Exception as e:
-            logger.error(f"Error saving summary_text: {e}")
-    
-    @database_sync_to_async
-    def mark_session_completed(self):
-        """Mark session as completed"""
+    def finalize_session(self, history, summary, final=True):
+        """
+        Save the transcript and summary, mark the session completed and
+        trigger webhook delivery
+        
+        All columns are written in a single UPDATE; the webhook is only
+        queued once that write has succeeded. collected_data is re-read under a
+        row lock, since other paths may have filled it in during the call, and
+        is only written when still empty or still what this consumer last
+        wrote. A re-save (final=False) leaves status and completed_at alone
+        and does not queue the webhook again.
+        """
         try:
-            session = MagicLinkSession.objects.get(session_id=self.session_id)
-            session.status = 'completed'
-            session.completed_at = timezone.now()
-            if not session.collected_data:
-                session.collected_data = self.collected_data
-            session.save()
+            session = self._get_session()
+            with transaction.atomic():
+                session.collected_data = MagicLinkSession.objects.select_for_update().values_list(
+                    'collected_data', flat=True
+                ).get(pk=session.pk)
+                session.conversation_history = history
+                session.summary_text = summary or ''
+                update_fields = ['conversation_history', 'summary_text']
+                if final:
+                    session.status = 'completed'
+                    session.completed_at = timezone.now()
+                    update_fields += ['status', 'completed_at']
+                if not session.collected_data or session.collected_data == self._saved_collected_data:
+                    session.collected_data = dict(self.collected_data)
+                    update_fields.append('collected_data')
+                session.save(update_fields=update_fields)
+                if 'collected_data' in update_fields:
+                    self._saved_collected_data = session.collected_data
         except Exception as e:
-            logger.error(f"Error marking session complete: {e}")
-    
-    @database_sync_to_async
-    def trigger_webhook(self):
-        """Trigger webhook delivery"""
+            logger.error(f"Error finalizing session: {e}")
+            return
+        
+        if not final:
+            return
+        
         try:
-            session = MagicLinkSession.objects.get(session_id=self.session_id)
-            form_config = session.form_config
-            webhook_url = getattr(form_config, 'callback_url', None)
-            if webhook_url:
-                # Trigger async task
+            if getattr(session.form_config, 'callback_url', None):
                 send_webhook.delay(session.session_id)
                 logger.info(f"Webhook triggered for session {self.session_id}")
             else:
@@ -724,7 +907,8 @@ LEGACY FALLBACK (only if necessary):
     def get_session_data(self):
         """Get session data from database"""
         try:
-            session = MagicLinkSession.objects.select_related('form_config').get(
+            # The transcript is rebuilt in memory and written wholesale on completion
+            session = MagicLinkSession.objects.defer('conversation_history').get(
                 session_id=self.session_id
             )
             
@@ -734,7 +918,9 @@ LEGACY FALLBACK (only if necessary):
             if session.status == 'completed':
                 return {'is_valid': False, 'error': 'Already completed'}
             
-            form = session.form_config
+            form = get_form_config(session.form_config_id) or session.form_config
+            session.form_config = form
+            self._session = session
             
             return {
                 'is_valid': True,
@@ -742,9 +928,10 @@ LEGACY FALLBACK (only if necessary):
                 'form_id': form.form_id,
                 'form_name': form.name,
                 'form_description': form.description,
+                'updated_at': form.updated_at,
                 'ai_prompt': form.ai_prompt,
                 'fields': form.fields,
-                'total_fields': len(form.fields),
+                'total_fields': form.total_fields,
                 'success_message': form.success_message
             }
         except MagicLinkSession.DoesNotExist:
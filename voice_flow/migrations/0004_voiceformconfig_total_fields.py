@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+def populate_total_fields(apps, schema_editor):
+    VoiceFormConfig = apps.get_model('voice_flow', 'VoiceFormConfig')
+    for form in VoiceFormConfig.objects.only('form_id', 'fields').iterator():
+        VoiceFormConfig.objects.filter(pk=form.pk).update(total_fields=len(form.fields or []))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice_flow', '0003_make_callback_url_optional'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voiceformconfig',
+            name='total_fields',
+            field=models.IntegerField(default=0, editable=False, help_text='Number of field definitions, kept in sync on save'),
+        ),
+        migrations.RunPython(populate_total_fields, migrations.RunPython.noop),
+    ]
@@ -4,10 +4,13 @@ Models for Voice Flow Service
 import secrets
 import hashlib
 from datetime import timedelta
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import F
+from django.db.models.expressions import RawSQL
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from . import json_utils
 
 
 def generate_api_key():
@@ -62,6 +65,7 @@ class VoiceFormConfig(models.Model):
     
     # Form Configuration
     fields = models.JSONField(help_text="Array of field definitions")
+    total_fields = models.IntegerField(default=0, editable=False, help_text="Number of field definitions, kept in sync on save")
     ai_prompt = models.TextField(help_text="Initial AI prompt for the conversation")
     
     # Callback Configuration (optional)
@@ -87,11 +91,108 @@ class VoiceFormConfig(models.Model):
     def __str__(self):
         return f"{self.name} ({self.form_id})"
     
+    def save(self, *args, **kwargs):
+        self.total_fields = len(self.fields or [])
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'fields' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'total_fields'}
+        super().save(*args, **kwargs)
+    
     def get_magic_link(self, domain_url):
         """Get the base magic link for this form"""
         return f"{domain_url}/f/{self.form_id}"
 
 
+class MagicLinkSessionQuerySet(models.QuerySet):
+    """Query helpers for MagicLinkSession"""
+    
+    def append_conversation_messages(self, messages):
+        """
+        Append messages to conversation_history without loading it
+        
+        On PostgreSQL this is a single jsonb concatenation UPDATE; other
+        backends fall back to a locked read-modify-write per session.
+        
+        Returns:
+            Number of sessions updated
+        """
+        messages = list(messages)
+        if not messages:
+            return 0
+        
+        if connections[self.db].vendor == 'postgresql':
+            return self.update(
+                conversation_history=RawSQL(
+                    'conversation_history || %s::jsonb', [json_utils.dumps(messages)]
+                ),
+                total_interactions=F('total_interactions') + len(messages)
+            )
+        
+        count = 0
+        with transaction.atomic(using=self.db):
+            for session in self.select_for_update().only(
+                'session_id', 'conversation_history', 'total_interactions'
+            ):
+                session.conversation_history.extend(messages)
+                session.total_interactions += len(messages)
+                session.save(update_fields=['conversation_history', 'total_interactions'])
+                count += 1
+        return count
+
+
+    def with_recent_messages(self, count):
+        """
+        Annotate each session with recent_messages, its last `count` conversation entries
+        
+        On PostgreSQL only that tail is built from the jsonb column, so the
+        full transcript is neither transferred nor decoded. Other backends
+        annotate the whole history; slice the result to be backend-agnostic.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            recent = RawSQL(
+                "(SELECT COALESCE(jsonb_agg(t.e ORDER BY t.i), '[]'::jsonb)"
+                " FROM jsonb_array_elements(conversation_history) WITH ORDINALITY AS t(e, i)"
+                " WHERE t.i > jsonb_array_length(conversation_history) - %s)",
+                [count],
+                output_field=models.JSONField()
+            )
+        else:
+            recent = F('conversation_history')
+        return self.annotate(recent_messages=recent)
+    
+    def set_collected_value(self, field_name, value):
+        """
+        Set one collected_data key and refresh fields_completed
+        
+        On PostgreSQL the key is written in place with jsonb_set, so the rest of
+        the blob is neither read nor rewritten from Python and concurrent
+        writers to different keys do not overwrite each other. Other backends
+        fall back to a locked read-modify-write per session.
+        
+        Returns:
+            Number of sessions updated
+        """
+        if connections[self.db].vendor == 'postgresql':
+            params = [field_name, json_utils.dumps(value)]
+            new_data = 'jsonb_set(collected_data, ARRAY[%s]::text[], %s::jsonb, true)'
+            return self.update(
+                collected_data=RawSQL(new_data, params),
+                fields_completed=RawSQL(
+                    f"(SELECT count(*) FROM jsonb_each({new_data}) AS e WHERE e.value <> 'null'::jsonb)",
+                    params
+                )
+            )
+        
+        count = 0
+        with transaction.atomic(using=self.db):
+            for session in self.select_for_update().only(
+                'session_id', 'collected_data', 'fields_completed'
+            ):
+                session.update_collected_data(field_name, value)
+                count += 1
+        return count
+
+
 class MagicLinkSession(models.Model):
     """Individual session for a magic link"""
     STATUS_CHOICES = [
@@ -133,6 +234,8 @@ class MagicLinkSession(models.Model):
     webhook_response_code = models.IntegerField(null=True, blank=True)
     webhook_sent_at = models.DateTimeField(null=True, blank=True)
     
+    objects = MagicLinkSessionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -154,20 +257,27 @@ class MagicLinkSession(models.Model):
     def mark_started(self):
         """Mark session as started"""
         if self.status == 'pending':
-            self.status = 'active'
-            self.started_at = timezone.now()
-            self.save(update_fields=['status', 'started_at'])
-    
-    def mark_completed(self):
+            # Conditional UPDATE so concurrent clicks cannot both start the session
+            started_at = timezone.now()
+            updated = MagicLinkSession.objects.filter(
+                pk=self.pk, status='pending'
+            ).update(status='active', started_at=started_at)
+            if updated:
+                self.status = 'active'
+                self.started_at = started_at
+    
+    def mark_completed(self, save=True):
         """Mark session as completed"""
         self.status = 'completed'
         self.completed_at = timezone.now()
         if self.started_at:
             self.duration_seconds = int((self.completed_at - self.started_at).total_seconds())
-        self.save(update_fields=['status', 'completed_at', 'duration_seconds'])
+        if save:
+            self.save(update_fields=['status', 'completed_at', 'duration_seconds'])
     
-    def add_conversation_message(self, role, content, field_name=None):
-        """Add a message to conversation history"""
+    @staticmethod
+    def build_conversation_message(role, content, field_name=None):
+        """Build a conversation history entry"""
         message = {
             'role': role,
             'content': content,
@@ -175,20 +285,26 @@ class MagicLinkSession(models.Model):
         }
         if field_name:
             message['field_name'] = field_name
+        return message
+    
+    def add_conversation_message(self, role, content, field_name=None):
+        """Add a message to conversation history"""
+        message = self.build_conversation_message(role, content, field_name)
         
         self.conversation_history.append(message)
         self.total_interactions += 1
         self.save(update_fields=['conversation_history', 'total_interactions'])
+        return message
     
     def update_collected_data(self, field_name, value):
         """Update collected data for a field"""
         self.collected_data[field_name] = value
-        self.fields_completed = len([v for v in self.collected_data.values() if v is not None])
+        self.fields_completed = sum(1 for v in self.collected_data.values() if v is not None)
         self.save(update_fields=['collected_data', 'fields_completed'])
     
     def get_completion_percentage(self):
         """Calculate completion percentage"""
-        total_fields = len(self.form_config.fields)
+        total_fields = self.form_config.total_fields
         if total_fields == 0:
             return 0
         return int((self.fields_completed / total_fields) * 100)
@@ -7,6 +7,23 @@ from datetime import timedelta
 from django.utils import timezone
 
 
+def _request_domain(context):
+    """
+    Scheme and host of the current request, computed once per serializer context
+    
+    List responses share one context across rows, so get_host() (which validates
+    against ALLOWED_HOSTS) runs once per response instead of once per object.
+    """
+    domain = context.get('_domain')
+    if domain is None:
+        request = context.get('request')
+        if request is None:
+            return None
+        domain = f"{request.scheme}://{request.get_host()}"
+        context['_domain'] = domain
+    return domain
+
+
 class FieldValidationSerializer(serializers.Serializer):
     """Validation rules for a field"""
     min_length = serializers.IntegerField(required=False)
@@ -70,9 +87,8 @@ class VoiceFormConfigSerializer(serializers.ModelSerializer):
     
     def get_magic_link(self, obj):
         """Get the magic link URL"""
-        request = self.context.get('request')
-        if request:
-            domain = f"{request.scheme}://{request.get_host()}"
+        domain = _request_domain(self.context)
+        if domain:
             return obj.get_magic_link(domain)
         return None
     
@@ -138,9 +154,8 @@ class MagicLinkSessionSerializer(serializers.ModelSerializer):
     
     def get_magic_link(self, obj):
         """Get the magic link URL"""
-        request = self.context.get('request')
-        if request:
-            domain = f"{request.scheme}://{request.get_host()}"
+        domain = _request_domain(self.context)
+        if domain:
             return obj.get_magic_link(domain)
         return None
     
@@ -0,0 +1,22 @@
+"""
+Signal handlers for Voice Flow models
+"""
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import VoiceFormConfig
+from .cache import invalidate_form_config
+
+
+@receiver(post_save, sender=VoiceFormConfig)
+@receiver(post_delete, sender=VoiceFormConfig)
+def invalidate_form_config_cache(sender, instance, using, **kwargs):
+    """
+    Evict a form configuration from cache when it changes
+    
+    Evicted immediately and again once the transaction commits, since a
+    concurrent reader may re-cache the old row before the commit is visible.
+    """
+    invalidate_form_config(instance.form_id)
+    transaction.on_commit(partial(invalidate_form_config, instance.form_id), using=using)
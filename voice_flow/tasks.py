@@ -1,19 +1,88 @@
 """
 Celery tasks for background processing
 """
-import json
 import hmac
-import hashlib
+import json
 import logging
-from datetime import datetime
+import time
 from celery import shared_task
 from django.utils import timezone
 from django.conf import settings
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from .ai_service import ai_service
+from .json_utils import canonical_json
 
 logger = logging.getLogger(__name__)
 
+# Only this much of a callback response is kept on the WebhookLog
+WEBHOOK_RESPONSE_LOG_CHARS = 1000
+WEBHOOK_RESPONSE_READ_BYTES = 2048
+
+# Longest Retry-After we honour inside a single delivery attempt
+WEBHOOK_MAX_RETRY_AFTER_SECONDS = 30
+
+# Methods a callback can be configured with (VoiceFormConfig.callback_method)
+WEBHOOK_METHODS = frozenset({'POST', 'PUT'})
+
+
+class _CappedRetry(Retry):
+    """Retry that never sleeps longer than WEBHOOK_MAX_RETRY_AFTER_SECONDS on Retry-After"""
+    
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, WEBHOOK_MAX_RETRY_AFTER_SECONDS)
+
+
+# Pooled HTTP session shared by webhook deliveries in this worker process
+_http_session = None
+
+
+def _get_http_session() -> requests.Session:
+    """
+    Return the pooled webhook session, creating it on first use
+    
+    Transient failures (connection errors, 429/500/502/503/504) are retried
+    inside urllib3 with exponential backoff and Retry-After support, capped
+    so a receiver cannot park the worker. Longer outages fall through to the
+    Celery task retry schedule below.
+    """
+    global _http_session
+    if _http_session is None:
+        retry = _CappedRetry(
+            total=settings.VOICE_FORM_SETTINGS.get('WEBHOOK_HTTP_RETRIES', 2),
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=WEBHOOK_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _http_session = session
+    return _http_session
+
+
+class WebhookDeliveryError(Exception):
+    """Callback endpoint answered with an error status (already logged)"""
+
+
+def _read_response_excerpt(response) -> str:
+    """Read a bounded prefix of a streamed response body and release the connection"""
+    try:
+        raw = response.raw.read(WEBHOOK_RESPONSE_READ_BYTES, decode_content=True) or b''
+    except Exception as e:
+        logger.debug(f"Could not read webhook response body: {e}")
+        raw = b''
+    finally:
+        response.close()
+    return raw.decode('utf-8', errors='replace')[:WEBHOOK_RESPONSE_LOG_CHARS]
+
 
 @shared_task(bind=True, max_retries=3)
 def send_webhook(self, session_id: str, attempt_number: int = 1):
@@ -26,6 +95,11 @@ def send_webhook(self, session_id: str, attempt_number: int = 1):
     """
     from .models import MagicLinkSession, WebhookLog
     
+    voice_settings = settings.VOICE_FORM_SETTINGS
+    form_config = None
+    payload = {}
+    headers = {}
+    
     try:
         session = MagicLinkSession.objects.get(session_id=session_id)
         form_config = session.form_config
@@ -49,7 +123,7 @@ def send_webhook(self, session_id: str, attempt_number: int = 1):
                 'duration_seconds': session.duration_seconds,
                 'completion_percentage': session.get_completion_percentage(),
                 'fields_completed': session.fields_completed,
-                'total_fields': len(form_config.fields),
+                'total_fields': form_config.total_fields,
                 'session_data': session.session_data,
                 'conversation_metrics': {
                     'total_interactions': session.total_interactions,
@@ -71,32 +145,41 @@ def send_webhook(self, session_id: str, attempt_number: int = 1):
         except Exception as e:
             logger.warning(f"Extraction for webhook failed: {e}")
         
-        # Generate signature
-        signature = generate_webhook_signature(payload, form_config.webhook_secret)
+        # Serialize once and sign the exact bytes that go on the wire (v2).
+        # The legacy re-serialized signature is still sent during the transition.
+        body = canonical_json(payload)
+        signature = sign_webhook_body(body, form_config.webhook_secret)
+        legacy_signature = generate_legacy_webhook_signature(payload, form_config.webhook_secret)
         
         # Prepare headers
         headers = {
             'Content-Type': 'application/json',
-            'X-VoiceForm-Signature': signature,
+            'X-VoiceForm-Signature': legacy_signature,
+            'X-VoiceForm-Signature-V2': signature,
             'X-VoiceForm-Session-ID': session.session_id,
-            'User-Agent': 'VoiceForms-Webhook/1.0'
+            'User-Agent': 'VoiceForms-Webhook/1.0',
+            # The response body is truncated for logging, so don't ask for gzip
+            'Accept-Encoding': 'identity'
         }
         
         # Send request
-        webhook_timeout = settings.VOICE_FORM_SETTINGS.get('WEBHOOK_TIMEOUT', 30)
-        start_time = datetime.now()
+        webhook_timeout = voice_settings.get('WEBHOOK_TIMEOUT', 30)
+        start_time = time.monotonic()
         
-        response = requests.request(
+        response = _get_http_session().request(
             method=form_config.callback_method,
             url=form_config.callback_url,
-            json=payload,
+            data=body,
             headers=headers,
-            timeout=webhook_timeout
+            timeout=webhook_timeout,
+            stream=True
         )
         
-        response_time_ms = int((datetime.now() - start_time).total_seconds() * 1000)
+        response_time_ms = int((time.monotonic() - start_time) * 1000)
+        response_body = _read_response_excerpt(response)
+        is_success = response.status_code < 400
         
-        # Log webhook
+        # Log webhook (one row per attempt, failed statuses included)
         webhook_log = WebhookLog.objects.create(
             session=session,
             url=form_config.callback_url,
@@ -104,14 +187,15 @@ def send_webhook(self, session_id: str, attempt_number: int = 1):
             payload=payload,
             headers=headers,
             status_code=response.status_code,
-            response_body=response.text[:1000],  # Limit response body size
+            response_body=response_body,
+            error_message='' if is_success else f"Webhook returned status {response.status_code}",
             response_time_ms=response_time_ms,
             attempt_number=attempt_number,
-            is_success=response.status_code < 400
+            is_success=is_success
         )
         
         # Update session
-        if response.status_code < 400:
+        if is_success:
             session.webhook_sent = True
             session.webhook_response_code = response.status_code
             session.webhook_sent_at = timezone.now()
@@ -125,28 +209,29 @@ def send_webhook(self, session_id: str, attempt_number: int = 1):
             }
         else:
             logger.warning(f"Webhook failed with status {response.status_code} for session {session_id}")
-            raise Exception(f"Webhook returned status {response.status_code}")
+            raise WebhookDeliveryError(f"Webhook returned status {response.status_code}")
     
     except Exception as exc:
         logger.error(f"Error sending webhook for session {session_id}: {exc}")
         
-        # Log failed attempt
+        # Log failed attempt, unless the error response was already logged above
         try:
-            WebhookLog.objects.create(
-                session_id=session_id,
-                url=form_config.callback_url if 'form_config' in locals() else 'unknown',
-                method=form_config.callback_method if 'form_config' in locals() else 'POST',
-                payload=payload if 'payload' in locals() else {},
-                headers=headers if 'headers' in locals() else {},
-                error_message=str(exc),
-                attempt_number=attempt_number,
-                is_success=False
-            )
+            if not isinstance(exc, WebhookDeliveryError):
+                WebhookLog.objects.create(
+                    session_id=session_id,
+                    url=form_config.callback_url if form_config else 'unknown',
+                    method=form_config.callback_method if form_config else 'POST',
+                    payload=payload,
+                    headers=headers,
+                    error_message=str(exc),
+                    attempt_number=attempt_number,
+                    is_success=False
+                )
         except:
             pass
         
         # Retry logic
-        max_retries = settings.VOICE_FORM_SETTINGS.get('WEBHOOK_RETRY_ATTEMPTS', 3)
+        max_retries = voice_settings.get('WEBHOOK_RETRY_ATTEMPTS', 3)
         if attempt_number < max_retries:
             # Exponential backoff: 5min, 15min, 45min
             countdown = 300 * (3 ** (attempt_number - 1))
@@ -164,6 +249,8 @@ def generate_webhook_signature(payload: dict, secret: str) -> str:
     """
     Generate HMAC signature for webhook payload
     
+    The signature covers the compact, key-sorted JSON encoding of the payload.
+    
     Args:
         payload: The payload dictionary
         secret: The webhook secret
@@ -171,12 +258,39 @@ def generate_webhook_signature(payload: dict, secret: str) -> str:
     Returns:
         Signature string in format 'sha256=<hex>'
     """
-    payload_str = json.dumps(payload, sort_keys=True)
-    signature = hmac.new(
-        secret.encode(),
-        payload_str.encode(),
-        hashlib.sha256
-    ).hexdigest()
+    return sign_webhook_body(canonical_json(payload), secret)
+
+
+def generate_legacy_webhook_signature(payload: dict, secret: str) -> str:
+    """
+    Generate the legacy X-VoiceForm-Signature value
+    
+    Covers json.dumps(payload, sort_keys=True) with default separators, which
+    receivers rebuild from the parsed body. Deprecated in favour of
+    X-VoiceForm-Signature-V2 and kept for one release.
+    
+    Args:
+        payload: The payload dictionary
+        secret: The webhook secret
+    
+    Returns:
+        Signature string in format 'sha256=<hex>'
+    """
+    return sign_webhook_body(json.dumps(payload, sort_keys=True).encode(), secret)
+
+
+def sign_webhook_body(body: bytes, secret: str) -> str:
+    """
+    Generate HMAC signature for an already-serialized webhook body
+    
+    Args:
+        body: The exact request body bytes
+        secret: The webhook secret
+    
+    Returns:
+        Signature string in format 'sha256=<hex>'
+    """
+    signature = hmac.digest(secret.encode(), body, 'sha256').hex()
     return f"sha256={signature}"
 
 
@@ -188,16 +302,16 @@ def cleanup_expired_sessions():
     from .models import MagicLinkSession
     
     cleanup_hours = settings.VOICE_FORM_SETTINGS.get('SESSION_CLEANUP_HOURS', 168)
-    cutoff_time = timezone.now() - timezone.timedelta(hours=cleanup_hours)
+    now = timezone.now()
+    cutoff_time = now - timezone.timedelta(hours=cleanup_hours)
     
     expired_sessions = MagicLinkSession.objects.filter(
-        expires_at__lt=timezone.now(),
+        expires_at__lt=now,
         status__in=['pending', 'active'],
         created_at__lt=cutoff_time
     )
     
-    count = expired_sessions.count()
-    expired_sessions.update(status='expired')
+    count = expired_sessions.update(status='expired')
     
     logger.info(f"Marked {count} sessions as expired")
     
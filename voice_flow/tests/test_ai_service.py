@@ -0,0 +1,33 @@
+"""
+Tests for AI service field validation
+"""
+from django.test import SimpleTestCase
+from voice_flow.ai_service import compile_field_validator
+
+
+class FieldValidatorTest(SimpleTestCase):
+    """Test compiled field validators"""
+
+    def test_email_only_needs_at_and_dot(self):
+        """Email check accepts anything with '@' and '.'"""
+        validate = compile_field_validator({'name': 'email', 'type': 'email'})
+        self.assertIsNone(validate('someone@example.com'))
+        self.assertIsNone(validate('first last@example.co'))
+        self.assertEqual(validate('someone@example'), 'Invalid email format')
+
+    def test_phone_is_not_validated(self):
+        """Phone answers are accepted as given"""
+        validate = compile_field_validator({'name': 'phone', 'type': 'phone'})
+        self.assertIsNone(validate('123'))
+        self.assertIsNone(validate('call me at the office'))
+
+    def test_required_and_number_bounds(self):
+        """Required and number bounds are enforced"""
+        validate = compile_field_validator({
+            'name': 'age', 'type': 'number', 'required': True,
+            'validation': {'min': 18, 'max': 99}
+        })
+        self.assertEqual(validate(''), 'This field is required')
+        self.assertEqual(validate(10), 'Must be at least 18')
+        self.assertEqual(validate('abc'), 'Must be a number')
+        self.assertIsNone(validate(30))
@@ -0,0 +1,63 @@
+"""
+Tests for form configuration caching
+"""
+from django.core.cache import cache
+from django.test import TestCase
+from voice_flow.cache import clear_local_form_configs, form_config_cache_key, get_active_form_config
+from voice_flow.models import APIKey, VoiceFormConfig
+
+
+class FormConfigCacheTest(TestCase):
+    """Test cached form configuration lookups"""
+    
+    def setUp(self):
+        cache.clear()
+        clear_local_form_configs()
+        self.api_key = APIKey.objects.create(name="Test Key")
+        self.form = VoiceFormConfig.objects.create(
+            api_key=self.api_key,
+            name="Test Form",
+            fields=[{"name": "test_field", "type": "text", "required": True, "prompt": "Test"}],
+            ai_prompt="Test AI prompt"
+        )
+    
+    def test_lookup_is_cached(self):
+        """Second lookup is served without a query"""
+        self.assertEqual(get_active_form_config(self.form.form_id).name, "Test Form")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_active_form_config(self.form.form_id).name, "Test Form")
+    
+    def test_local_layer_skips_cache_backend(self):
+        """Warm lookups are answered in-process without touching the cache backend"""
+        get_active_form_config(self.form.form_id)
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_active_form_config(self.form.form_id).name, "Test Form")
+    
+    def test_save_invalidates_cache(self):
+        """Saving the form evicts the cached copy"""
+        get_active_form_config(self.form.form_id)
+        self.form.name = "Renamed Form"
+        self.form.save()
+        self.assertEqual(get_active_form_config(self.form.form_id).name, "Renamed Form")
+    
+    def test_invalidated_again_on_commit(self):
+        """A copy re-cached before the commit is evicted once it commits"""
+        stale = get_active_form_config(self.form.form_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.form.name = "Renamed Form"
+            self.form.save()
+            # A concurrent reader re-caching the pre-commit row
+            cache.set(form_config_cache_key(self.form.form_id), stale)
+        self.assertEqual(get_active_form_config(self.form.form_id).name, "Renamed Form")
+    
+    def test_inactive_form_not_returned(self):
+        """Deactivated forms are not served from cache"""
+        get_active_form_config(self.form.form_id)
+        self.form.is_active = False
+        self.form.save()
+        self.assertIsNone(get_active_form_config(self.form.form_id))
+    
+    def test_missing_form(self):
+        """Unknown form IDs return None"""
+        self.assertIsNone(get_active_form_config('f_missing'))
@@ -0,0 +1,135 @@
+"""
+Tests for the voice conversation consumer
+"""
+import asyncio
+from django.test import SimpleTestCase
+from voice_flow import json_utils
+from voice_flow.consumers import VoiceConversationConsumer
+
+
+class InboxCoalescingTest(SimpleTestCase):
+    """Test ordering and coalescing of queued user input"""
+
+    # Arrival times are injected relative to a base well in the past, so no
+    # burst deadline lies in the future and nothing depends on wall-clock timing
+    BASE_OFFSET = 100.0
+
+    def _run_inbox(self, scenario):
+        """
+        Run scenario(consumer, enqueue, handled) against a live inbox
+
+        enqueue(offset, data) queues data as if it arrived `offset` seconds
+        after the base time. The run ends once a trailing 'done' message is
+        dispatched, and returns the data of every handled text message.
+        """
+        handled = []
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            base = loop.time() - self.BASE_OFFSET
+            finished = asyncio.Event()
+
+            def enqueue(offset, data):
+                consumer._inbox.put_nowait((base + offset, data))
+
+            async def dispatch(data):
+                if data['type'] == 'done':
+                    finished.set()
+                    return
+                handled.append(data['data'])
+                await consumer.on_dispatch(data)
+
+            consumer = VoiceConversationConsumer()
+            consumer.session_id = 's_test'
+            consumer._inbox = asyncio.Queue()
+            consumer._dispatch = dispatch
+            consumer.on_dispatch = self._noop
+            task = asyncio.create_task(consumer._process_inbox())
+            try:
+                await scenario(consumer, enqueue)
+                enqueue(self.BASE_OFFSET / 2, {'type': 'done'})
+                await asyncio.wait_for(finished.wait(), timeout=5)
+            finally:
+                task.cancel()
+
+        asyncio.run(run())
+        return handled
+
+    @staticmethod
+    async def _noop(data):
+        pass
+
+    @staticmethod
+    def _text(answer):
+        return {'type': 'text', 'data': answer}
+
+    def test_answers_sent_during_slow_turn_are_all_handled(self):
+        """Separate answers queued behind a running handler are not dropped"""
+        async def scenario(consumer, enqueue):
+            started = asyncio.Event()
+            release = asyncio.Event()
+
+            async def slow_turn(data):
+                if data['data'] == 'first':
+                    started.set()
+                    await release.wait()
+
+            consumer.on_dispatch = slow_turn
+            enqueue(0, self._text('first'))
+            await started.wait()
+            enqueue(1, self._text('second'))
+            enqueue(2, self._text('third'))
+            release.set()
+
+        self.assertEqual(self._run_inbox(scenario), ['first', 'second', 'third'])
+
+    def test_burst_keeps_latest_answer(self):
+        """Answers arriving within the coalesce window collapse to the last one"""
+        async def scenario(consumer, enqueue):
+            enqueue(0, self._text('draft'))
+            enqueue(0, self._text('final'))
+
+        self.assertEqual(self._run_inbox(scenario), ['final'])
+
+    def test_answers_outside_window_are_kept_in_order(self):
+        """Queued answers further apart than the window are each handled"""
+        async def scenario(consumer, enqueue):
+            enqueue(0, self._text('first'))
+            enqueue(1, self._text('second'))
+            enqueue(1, self._text('second, corrected'))
+            enqueue(2, self._text('third'))
+
+        self.assertEqual(self._run_inbox(scenario), ['first', 'second, corrected', 'third'])
+
+
+class CompletedSessionTest(SimpleTestCase):
+    """Test that a completed session ignores further input"""
+
+    def test_input_after_completion_is_rejected(self):
+        """No handler (and so no re-completion or webhook) runs once completed"""
+        handled = []
+
+        async def handler(*args, **kwargs):
+            handled.append(args)
+
+        async def run():
+            consumer = VoiceConversationConsumer()
+            consumer.session_id = 's_test'
+            consumer._session_state = {'status': 'completed'}
+            sent = []
+
+            async def send(text_data=None, bytes_data=None):
+                sent.append(text_data)
+
+            consumer.send = send
+            consumer.handle_text_input = handler
+            consumer.handle_skip_field = handler
+            consumer.handle_completion = handler
+            for message_type in ('text', 'skip_field', 'complete'):
+                await consumer._dispatch({'type': message_type, 'data': 'late answer'})
+            return sent
+
+        sent = asyncio.run(run())
+        self.assertEqual(handled, [])
+        self.assertEqual(len(sent), 3)
+        self.assertEqual(json_utils.loads(sent[0])['message'], 'Session already completed')
@@ -0,0 +1,22 @@
+"""
+Tests for JSON helpers
+"""
+import json
+from django.test import SimpleTestCase
+from voice_flow.json_utils import canonical_json
+
+
+class CanonicalJSONTest(SimpleTestCase):
+    """Test the byte format webhook bodies are signed over"""
+    
+    def test_matches_stdlib_encoding(self):
+        """Floats and big integers encode exactly as the stdlib does"""
+        payload = {'b': 1e16, 'a': 1e-7, 'c': 2 ** 70, 'd': 0.1, 'e': 'café'}
+        expected = json.dumps(
+            payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False
+        ).encode('utf-8')
+        self.assertEqual(canonical_json(payload), expected)
+        self.assertEqual(
+            canonical_json(payload),
+            '{"a":1e-07,"b":1e+16,"c":1180591620717411303424,"d":0.1,"e":"café"}'.encode('utf-8')
+        )
@@ -1,6 +1,8 @@
 """
 Tests for Voice Flow models
 """
+import unittest
+from django.db import connection
 from django.test import TestCase
 from datetime import timedelta
 from django.utils import timezone
@@ -73,6 +75,21 @@ class VoiceFormConfigModelTest(TestCase):
         magic_link = form.get_magic_link("http://localhost:8000")
         self.assertIn(form.form_id, magic_link)
         self.assertTrue(magic_link.startswith("http://localhost:8000/f/"))
+    
+    def test_total_fields_kept_in_sync(self):
+        """Test total_fields follows the field definitions on save"""
+        form = VoiceFormConfig.objects.create(
+            api_key=self.api_key,
+            name="Test Form",
+            fields=[{"name": "a", "type": "text", "prompt": "A"}],
+            ai_prompt="Test"
+        )
+        self.assertEqual(form.total_fields, 1)
+        
+        form.fields.append({"name": "b", "type": "text", "prompt": "B"})
+        form.save(update_fields=['fields'])
+        form.refresh_from_db()
+        self.assertEqual(form.total_fields, 2)
 
 
 class MagicLinkSessionModelTest(TestCase):
@@ -179,3 +196,144 @@ class MagicLinkSessionModelTest(TestCase):
         self.assertEqual(len(session.conversation_history), 2)
         self.assertEqual(session.total_interactions, 2)
 
+    
+    def test_mark_completed_without_save(self):
+        """Test marking completed in memory only"""
+        session = MagicLinkSession.objects.create(
+            form_config=self.form,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        
+        session.mark_completed(save=False)
+        self.assertEqual(session.status, 'completed')
+        self.assertIsNotNone(session.completed_at)
+        
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'pending')
+    
+    def test_append_conversation_messages(self):
+        """Test appending conversation messages through the queryset"""
+        session = MagicLinkSession.objects.create(
+            form_config=self.form,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        session.add_conversation_message('assistant', 'Hi there')
+        
+        messages = [
+            MagicLinkSession.build_conversation_message('user', 'Hello', 'field1'),
+            MagicLinkSession.build_conversation_message('assistant', 'Thanks!', 'field1'),
+        ]
+        updated = MagicLinkSession.objects.filter(
+            session_id=session.session_id
+        ).append_conversation_messages(messages)
+        
+        self.assertEqual(updated, 1)
+        session.refresh_from_db()
+        self.assertEqual([m['content'] for m in session.conversation_history], ['Hi there', 'Hello', 'Thanks!'])
+        self.assertEqual(session.conversation_history[1]['field_name'], 'field1')
+        self.assertEqual(session.total_interactions, 3)
+    
+    def test_set_collected_value(self):
+        """Test setting a collected value through the queryset"""
+        session = MagicLinkSession.objects.create(
+            form_config=self.form,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        session.update_collected_data('field1', 'value1')
+        
+        sessions = MagicLinkSession.objects.filter(session_id=session.session_id)
+        self.assertEqual(sessions.set_collected_value('field2', None), 1)
+        session.refresh_from_db()
+        self.assertEqual(session.collected_data, {'field1': 'value1', 'field2': None})
+        self.assertEqual(session.fields_completed, 1)
+        
+        sessions.set_collected_value('field2', 'value2')
+        session.refresh_from_db()
+        self.assertEqual(session.collected_data['field2'], 'value2')
+        self.assertEqual(session.fields_completed, 2)
+    
+    def test_with_recent_messages(self):
+        """Test annotating the conversation tail"""
+        session = MagicLinkSession.objects.create(
+            form_config=self.form,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        for content in ('one', 'two', 'three'):
+            session.add_conversation_message('user', content)
+        
+        annotated = MagicLinkSession.objects.with_recent_messages(2).get(session_id=session.session_id)
+        self.assertEqual([m['content'] for m in annotated.recent_messages[-2:]], ['two', 'three'])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL-only jsonb code paths')
+class MagicLinkSessionPostgresQueryTest(TestCase):
+    """Test the jsonb UPDATE paths of MagicLinkSessionQuerySet"""
+    
+    def setUp(self):
+        self.api_key = APIKey.objects.create(name="Test Key")
+        self.form = VoiceFormConfig.objects.create(
+            api_key=self.api_key,
+            name="Test Form",
+            fields=[
+                {"name": "field1", "type": "text", "required": True, "prompt": "Q1"},
+                {"name": "address", "type": "text", "required": False, "prompt": "Q2"}
+            ],
+            ai_prompt="Test"
+        )
+        self.session = MagicLinkSession.objects.create(
+            form_config=self.form,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        self.sessions = MagicLinkSession.objects.filter(session_id=self.session.session_id)
+    
+    def test_append_keeps_order(self):
+        """jsonb concatenation appends after existing messages, in order"""
+        self.session.add_conversation_message('assistant', 'first')
+        
+        self.sessions.append_conversation_messages([
+            MagicLinkSession.build_conversation_message('user', 'second', 'field1'),
+            MagicLinkSession.build_conversation_message('assistant', 'third'),
+        ])
+        self.sessions.append_conversation_messages([
+            MagicLinkSession.build_conversation_message('user', 'fourth'),
+        ])
+        
+        self.session.refresh_from_db()
+        self.assertEqual(
+            [m['content'] for m in self.session.conversation_history],
+            ['first', 'second', 'third', 'fourth']
+        )
+        self.assertEqual(self.session.conversation_history[1]['field_name'], 'field1')
+        self.assertEqual(self.session.total_interactions, 4)
+    
+    def test_set_nested_value(self):
+        """jsonb_set writes one key, keeps the others and recounts non-null values"""
+        self.sessions.set_collected_value('field1', 'value1')
+        self.sessions.set_collected_value('address', {'city': 'Oslo', 'lines': ['1 Main St']})
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.collected_data, {
+            'field1': 'value1',
+            'address': {'city': 'Oslo', 'lines': ['1 Main St']},
+        })
+        self.assertEqual(self.session.fields_completed, 2)
+        
+        self.sessions.set_collected_value('address', {'city': 'Bergen'})
+        self.sessions.set_collected_value('field1', None)
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.collected_data, {'field1': None, 'address': {'city': 'Bergen'}})
+        self.assertEqual(self.session.fields_completed, 1)
+    
+    def test_recent_messages_reads_only_the_tail(self):
+        """The jsonb annotation returns just the last messages, oldest first"""
+        for content in ('one', 'two', 'three', 'four'):
+            self.session.add_conversation_message('user', content)
+        
+        annotated = self.sessions.with_recent_messages(3).get()
+        self.assertEqual([m['content'] for m in annotated.recent_messages], ['two', 'three', 'four'])
+        
+        empty = MagicLinkSession.objects.create(
+            form_config=self.form,
+            expires_at=timezone.now() + timedelta(hours=24)
+        )
+        annotated = MagicLinkSession.objects.with_recent_messages(3).get(session_id=empty.session_id)
+        self.assertEqual(annotated.recent_messages, [])
@@ -0,0 +1,28 @@
+"""
+Tests for webhook signatures
+"""
+import hashlib
+import hmac
+import json
+from django.test import SimpleTestCase
+from voice_flow.json_utils import canonical_json
+from voice_flow.tasks import generate_legacy_webhook_signature, generate_webhook_signature
+
+
+class WebhookSignatureTest(SimpleTestCase):
+    """Test both signature versions sent during the transition"""
+    
+    payload = {'session_id': 's_1', 'data': {'rating': 8, 'note': 'café'}, 'score': 1e16}
+    secret = 'wh_test'
+    
+    def test_legacy_signature_unchanged(self):
+        """X-VoiceForm-Signature still matches the documented pre-V2 check"""
+        expected = hmac.new(
+            self.secret.encode(), json.dumps(self.payload, sort_keys=True).encode(), hashlib.sha256
+        ).hexdigest()
+        self.assertEqual(generate_legacy_webhook_signature(self.payload, self.secret), f"sha256={expected}")
+    
+    def test_v2_signature_covers_body(self):
+        """X-VoiceForm-Signature-V2 is computed over the exact body bytes"""
+        expected = hmac.new(self.secret.encode(), canonical_json(self.payload), hashlib.sha256).hexdigest()
+        self.assertEqual(generate_webhook_signature(self.payload, self.secret), f"sha256={expected}")
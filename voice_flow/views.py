@@ -5,6 +5,7 @@ from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
 from django.shortcuts import render, get_object_or_404
+from django.http import Http404
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
@@ -23,6 +24,7 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login as auth_login
 from django.shortcuts import redirect
 from .models import VoiceFormConfig, MagicLinkSession, APIKey
+from .cache import get_active_form_config
 from .serializers import (
     VoiceFormConfigSerializer,
     MagicLinkSessionSerializer,
@@ -144,13 +146,15 @@ class MagicLinkSessionViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Return sessions for forms owned by the authenticated principal (session user or API key)."""
+        # The serializer reads form name and field count from the form, but never the transcript
+        sessions = MagicLinkSession.objects.select_related('form_config').defer('conversation_history')
         # API key auth path
         if hasattr(self.request, 'auth') and self.request.auth:
-            return MagicLinkSession.objects.filter(form_config__api_key=self.request.auth)
+            return sessions.filter(form_config__api_key=self.request.auth)
         # Session user path
         user = getattr(self.request, 'user', None)
         if getattr(user, 'is_authenticated', False):
-            return MagicLinkSession.objects.filter(form_config__api_key__user=user)
+            return sessions.filter(form_config__api_key__user=user)
         return MagicLinkSession.objects.none()
     
     @action(detail=True, methods=['post'], url_path='retry-webhook')
@@ -189,7 +193,9 @@ def form_interface(request, form_id):
     Render the voice interface for a form
     This is accessed via the base magic link
     """
-    form_config = get_object_or_404(VoiceFormConfig, form_id=form_id, is_active=True)
+    form_config = get_active_form_config(form_id)
+    if form_config is None:
+        raise Http404("Form not found")
     
     # Create a new session
     default_expiry = settings.VOICE_FORM_SETTINGS.get('DEFAULT_SESSION_EXPIRY_HOURS', 24)
@@ -217,7 +223,14 @@ def session_interface(request, session_id):
     Render the voice interface for a specific session
     This is accessed via the session-specific magic link
     """
-    session = get_object_or_404(MagicLinkSession, session_id=session_id)
+    # The interface only needs status/timing columns plus the form config,
+    # so skip the large JSON columns and fetch the form in the same query
+    session = get_object_or_404(
+        MagicLinkSession.objects.select_related('form_config').defer(
+            'session_data', 'collected_data', 'conversation_history'
+        ),
+        session_id=session_id
+    )
     
     # Check if expired
     if session.is_expired():
@@ -265,7 +278,7 @@ def finalize_session_public(request, session_id):
     # Update collected data
     for k, v in fields.items():
         session.collected_data[k] = v
-    session.fields_completed = len([v for v in session.collected_data.values() if v is not None])
+    session.fields_completed = sum(1 for v in session.collected_data.values() if v is not None)
     session.save(update_fields=['collected_data', 'fields_completed'])
     
     return Response({'ok': True, 'collected_data': session.collected_data})
@@ -199,10 +199,16 @@ VOICE_FORM_SETTINGS = {
     'MAX_FORM_FIELDS': 50,
     'WEBHOOK_TIMEOUT': int(os.getenv('WEBHOOK_TIMEOUT', 30)),
     'WEBHOOK_RETRY_ATTEMPTS': int(os.getenv('WEBHOOK_RETRY_ATTEMPTS', 3)),
+    # Quick in-request retries for transient HTTP failures (before Celery retries)
+    'WEBHOOK_HTTP_RETRIES': int(os.getenv('WEBHOOK_HTTP_RETRIES', 2)),
     'AI_RESPONSE_TIMEOUT': 30,
+    # How long generated form schemas are reused for identical descriptions
+    'AI_RESPONSE_CACHE_SECONDS': int(os.getenv('AI_RESPONSE_CACHE_SECONDS', 86400)),
     'AUDIO_MAX_SIZE_MB': 10,
     'SUPPORTED_AUDIO_FORMATS': ['webm', 'wav', 'mp3', 'ogg', 'opus', 'pcm'],
     'SESSION_CLEANUP_HOURS': int(os.getenv('SESSION_CLEANUP_HOURS', 168)),
+    'FORM_CONFIG_CACHE_SECONDS': int(os.getenv('FORM_CONFIG_CACHE_SECONDS', 300)),
+    'FORM_CONFIG_LOCAL_CACHE_SECONDS': int(os.getenv('FORM_CONFIG_LOCAL_CACHE_SECONDS', 30)),
     'DOMAIN_URL': os.getenv('DOMAIN_URL', 'http://localhost:8000'),
     # Use Live API for real-time bidirectional audio streaming
     'USE_LIVE_API': os.getenv('USE_LIVE_API', 'True') == 'True',